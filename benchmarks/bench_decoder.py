@@ -0,0 +1,146 @@
+"""Compare frames/sec of the table driven frame decoder against the if/elif chain it replaced.
+
+Both sides do the same work per frame: read the fields, build the response to pushed frames and walk the records of
+state dumps. Only the hub lookups and entity updates are left out, they are the same for both.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_decoder.py
+"""
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.cync_lights.cync_hub import DeviceStates, InitialState, PUSH_RESPONSE, PushReceived, decode_frame
+
+SWITCH_ID = 1234567
+
+def state_change_frame():
+    packet = bytearray(33)
+    packet[0:6] = struct.pack(">IH", SWITCH_ID, 17)
+    packet[13] = 219
+    packet[21] = 5
+    packet[27] = 1
+    packet[28] = 80
+    return 115, bytes(packet)
+
+def sensor_frame():
+    packet = bytearray(25)
+    packet[0:6] = struct.pack(">IH", SWITCH_ID, 18)
+    packet[13] = 84
+    packet[16] = 7
+    packet[22] = 1
+    packet[24] = 1
+    return 131, bytes(packet)
+
+def initial_state_frame(records=10):
+    packet = bytearray(22)
+    packet[0:6] = struct.pack(">IH", SWITCH_ID, 19)
+    packet[13] = 82
+    for mesh_index in range(records):
+        packet += bytes([mesh_index, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 50, 0, 0, 0, 254, 0, 0, 0, 255, 0, 0, 0])
+    return 115, bytes(packet + b'\x00')
+
+def device_states_frame(records=10):
+    packet = bytearray(struct.pack(">I", SWITCH_ID) + bytes([1, 1, 6]))
+    for mesh_index in range(records):
+        packet += bytes([0, 0, 0, mesh_index, 1, 50, 254, 255, 0, 0]) + bytes(9)
+    return 67, bytes(packet)
+
+def controller_online_frame():
+    return 171, struct.pack(">I", SWITCH_ID)
+
+def ack_frame():
+    return 123, struct.pack(">IHB", SWITCH_ID, 42, 0)
+
+FRAMES = [state_change_frame(), sensor_frame(), initial_state_frame(), device_states_frame(), controller_online_frame(), ack_frame(), state_change_frame()]
+
+def legacy_decode(packet_type, packet):
+    """The if/elif chain of _read_tcp_messages with the hub lookups and updates replaced by collecting their arguments"""
+    packet_length = len(packet)
+    results = []
+    if packet_type == 115:
+        switch_id = str(struct.unpack(">I", packet[0:4])[0])
+        response_id = struct.unpack(">H", packet[4:6])[0]
+        response_packet = bytes.fromhex('7300000007') + int(switch_id).to_bytes(4,'big') + response_id.to_bytes(2,'big') + bytes.fromhex('00')
+        results.append(response_packet)
+        if packet_length >= 33 and int(packet[13]) == 219:
+            state = int(packet[27]) > 0
+            brightness = int(packet[28]) if state else 0
+            results.append((switch_id, int(packet[21]), state, brightness))
+        elif packet_length >= 25 and int(packet[13]) == 84:
+            motion = int(packet[22]) > 0
+            ambient_light = int(packet[24]) > 0
+            results.append((switch_id, int(packet[16]), motion, ambient_light))
+        elif packet_length > 51 and int(packet[13]) == 82:
+            switch_id = str(struct.unpack(">I", packet[0:4])[0])
+            packet = packet[22:]
+            while len(packet) > 24:
+                state = int(packet[8]) > 0
+                brightness = int(packet[12]) if state else 0
+                color_temp = int(packet[16])
+                rgb = {'r':int(packet[20]),'g':int(packet[21]),'b':int(packet[22]),'active':int(packet[16])==254}
+                results.append((switch_id, int(packet[0]), state, brightness, color_temp, rgb))
+                packet = packet[24:]
+    elif packet_type == 131:
+        switch_id = str(struct.unpack(">I", packet[0:4])[0])
+        if packet_length >= 33 and int(packet[13]) == 219:
+            state = int(packet[27]) > 0
+            brightness = int(packet[28]) if state else 0
+            results.append((switch_id, int(packet[21]), state, brightness))
+        elif packet_length >= 25 and int(packet[13]) == 84:
+            motion = int(packet[22]) > 0
+            ambient_light = int(packet[24]) > 0
+            results.append((switch_id, int(packet[16]), motion, ambient_light))
+    elif packet_type == 67 and packet_length >= 26 and int(packet[4]) == 1 and int(packet[5]) == 1 and int(packet[6]) == 6:
+        switch_id = str(struct.unpack(">I", packet[0:4])[0])
+        packet = packet[7:]
+        while len(packet) >= 19:
+            state = int(packet[4]) > 0
+            brightness = int(packet[5]) if state else 0
+            color_temp = int(packet[6])
+            rgb = {'r':int(packet[7]),'g':int(packet[8]),'b':int(packet[9]),'active':int(packet[6])==254}
+            results.append((switch_id, int(packet[3]), state, brightness, color_temp, rgb))
+            packet = packet[19:]
+    elif packet_type == 171:
+        switch_id = str(struct.unpack(">I", packet[0:4])[0])
+        results.append(switch_id)
+    elif packet_type == 123:
+        seq = str(struct.unpack(">H", packet[4:6])[0])
+        results.append(seq)
+    return results
+
+def table_decode(packet_type, packet):
+    """decode_frame followed by the work the hub's event handlers do before their lookups and updates"""
+    results = []
+    for event in decode_frame(packet_type, packet):
+        if type(event) is PushReceived:
+            results.append(PUSH_RESPONSE.pack(115, 7, int(event.switch_id), event.response_id, 0))
+        elif type(event) is InitialState or type(event) is DeviceStates:
+            for mesh_index, state, brightness, color_temp, r, g, b in event.records:
+                state = state > 0
+                results.append((event.switch_id, mesh_index, state, brightness if state else 0, color_temp, {'r':r,'g':g,'b':b,'active':color_temp==254}))
+        else:
+            results.append(event)
+    return results
+
+def run(decoder, frames):
+    for packet_type, packet in frames:
+        decoder(packet_type, packet)
+
+def main():
+    #the chain sliced bytes read from the socket, the table is fed memoryviews by the frame reader
+    runs = (
+        ("if/elif chain", legacy_decode, [(packet_type, packet) for packet_type, packet in FRAMES] * 200),
+        ("decoder table", table_decode, [(packet_type, memoryview(packet)) for packet_type, packet in FRAMES] * 200),
+    )
+    number = 50
+    for name, decoder, frames in runs:
+        best = min(timeit.repeat(lambda: run(decoder, frames), number=number, repeat=5))
+        print(f"{name:>14}: {len(frames) * number / best:12,.0f} frames/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Measure the memory held by a CyncHub and the cost of a state update per device.
+
+The slotted device model is compared against the same attributes stored in a plain __dict__ object with RGB kept
+as a dict, the way devices were stored before.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_memory.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.cync_lights.cync_hub import CyncColor, CyncHub
+from synthetic import make_user_data
+
+DEVICES = 5000
+
+class DictDevice:
+    """Plain object holding the same attributes as a device, without __slots__"""
+
+def traced(build):
+    tracemalloc.start()
+    result = build()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, current
+
+def copy_devices(devices, slotted):
+    """Copy the attributes of devices into new slotted objects or __dict__ objects with RGB as a dict"""
+    copies = []
+    for device in devices:
+        copy = object.__new__(type(device)) if slotted else DictDevice()
+        for name in type(device).__slots__:
+            value = getattr(device, name)
+            if name == "rgb" and not slotted:
+                value = {'r':value.r, 'g':value.g, 'b':value.b, 'active':value.active}
+            setattr(copy, name, value)
+        copies.append(copy)
+    return copies
+
+def main():
+    user_data, options = make_user_data(DEVICES, homes=2)
+    hub, hub_bytes = traced(lambda: CyncHub(user_data, options, lambda: None))
+    devices = list(hub.cync_switches.values()) + list(hub.cync_rooms.values())
+    print(f"CyncHub with {DEVICES} devices: {hub_bytes/1024:10.1f} KiB ({hub_bytes/DEVICES:6.0f} B/device)")
+    for name, slotted in (("__slots__", True), ("__dict__", False)):
+        _, device_bytes = traced(lambda: copy_devices(devices, slotted))
+        print(f"{len(devices)} switches and rooms with {name:>9}: {device_bytes/1024:10.1f} KiB ({device_bytes/len(devices):6.0f} B/object)")
+
+    switches = list(hub.cync_switches.values())
+    colors = [CyncColor(index % 256, 0, 255 - index % 256, index % 2 == 0) for index in range(len(switches))]
+    def update():
+        for switch, color in zip(switches, colors):
+            switch.update_switch(True, 50, 20, color)
+        hub.flush_updates()
+        for switch in switches:
+            switch.update_switch(False, 0, 20, switch.rgb)
+        hub.flush_updates()
+    number = 5
+    best = min(timeit.repeat(update, number=number, repeat=3))
+    print(f"state update and room flush: {best*1e6/(number*2*len(switches)):8.2f} us/update")
+
+if __name__ == "__main__":
+    main()
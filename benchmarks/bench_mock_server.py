@@ -0,0 +1,93 @@
+"""Drive a CyncHub against the mock Cync server over a local socket.
+
+Reported are the time from start_tcp_client until the state dumps reached every switch, and the ack latency
+percentiles and commands/sec of switch commands sent one at a time and all at once. The hub's switch states are then
+checked against the mock's devices.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_mock_server.py
+    python benchmarks/bench_mock_server.py --devices 600 --latency 0.02 --loss 0.01
+
+Exits with status 1 when the hub does not sync, a command is not acknowledged or the hub's state differs from the mock.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.cync_lights.cync_hub import CyncHub
+from mock_server import MockCyncServer
+from synthetic import make_user_data
+
+SYNC_TIMEOUT = 30
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values)*fraction))]
+
+async def wait_for_sync(switches):
+    start = time.perf_counter()
+    while not all(switch.update_received for switch in switches):
+        if time.perf_counter() - start > SYNC_TIMEOUT:
+            return None
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+async def timed_command(switch, brightness):
+    start = time.perf_counter()
+    acked = await switch.turn_on(None, brightness, None)
+    return acked, time.perf_counter() - start
+
+def report(name, results, elapsed):
+    latencies = sorted(latency for acked, latency in results)
+    failed = sum(not acked for acked, latency in results)
+    print(f"{name:>11}: {len(results)/elapsed:8,.0f} commands/sec, ack p50 {percentile(latencies, 0.5)*1000:6.1f} ms, p99 {percentile(latencies, 0.99)*1000:6.1f} ms, {failed} not acknowledged")
+    return failed
+
+async def run(args):
+    user_data, options = make_user_data(args.devices)
+    server = await MockCyncServer(user_data['cync_config'], latency = args.latency, loss = args.loss, seed = 0).start()
+    hub = CyncHub(user_data, options, lambda: None, host = '127.0.0.1', port = server.port, tls = False)
+    #the mock only reports devices that have a mesh index in its state records
+    switches = [switch for device_id, switch in hub.cync_switches.items() if device_id in server.mesh_indexes]
+    failures = 0
+    try:
+        hub.start_tcp_client()
+        synced = await wait_for_sync(switches)
+        if synced is None:
+            print(f"state of {sum(not switch.update_received for switch in switches)} of {len(switches)} switches not received after {SYNC_TIMEOUT} s")
+            return 1
+        print(f"{len(switches)} switches synced in {synced:.2f} s")
+
+        rng = random.Random(0)
+        targets = rng.sample(switches, min(args.commands, len(switches)))
+        start = time.perf_counter()
+        results = [await timed_command(switch, rng.randint(1, 255)) for switch in targets]
+        failures += report("sequential", results, time.perf_counter() - start)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[timed_command(switch, rng.randint(1, 255)) for switch in targets])
+        failures += report("concurrent", results, time.perf_counter() - start)
+
+        await asyncio.sleep(args.latency + 0.5)
+        mismatched = [switch.device_id for switch in targets if [switch.power_state, switch.brightness] != server.states[switch.device_id][:2]]
+        print(f"{len(mismatched)} of {len(targets)} switches differ from the mock")
+        failures += len(mismatched)
+    finally:
+        hub.disconnect()
+        await server.stop()
+    return 1 if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=300, help="number of synthetic devices, default 300")
+    parser.add_argument("--commands", type=int, default=100, help="commands per run, default 100")
+    parser.add_argument("--latency", type=float, default=0.005, help="reply delay of the mock in seconds, default 0.005")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of replies the mock drops, default 0")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Replay frame streams through CyncHub._process_data, the decoding and state update path of _read_tcp_messages.
+
+Every stream is cut into socket sized reads and replayed without sockets. Reported per stream are frames/sec, the
+latency percentiles of processing one frame at a time and the peak and retained memory traced during a replay.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_replay.py
+    python benchmarks/bench_replay.py --save baseline.json
+    python benchmarks/bench_replay.py --compare baseline.json
+    python benchmarks/bench_replay.py --capture cync_lights_capture.bin
+
+--compare exits with status 1 when the frames/sec of a stream dropped by more than --tolerance. --capture replays the
+inbound frames of a file recorded with the start_capture service through the frame decoder instead, a full replay
+needs the config entry the capture was recorded with, see capture.replay_capture.
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.cync_lights.capture import CaptureFile
+from custom_components.cync_lights.cync_hub import CyncFrameReader, CyncHub, DEVICE_STATE_RECORD, INITIAL_STATE_RECORD, PACKET_HEADER, SWITCH_ID, decode_frame
+from mock_server import frame
+from synthetic import make_user_data
+
+DEVICES = 2000
+READ_SIZE = 1460
+DUMP_RECORDS = 256
+
+class NullWriter:
+    """Stands in for the StreamWriter that push responses are written to"""
+
+    def write(self, data):
+        pass
+
+def make_hub():
+    user_data, options = make_user_data(DEVICES, homes=2)
+    for device_info in user_data['cync_config']['devices'].values():
+        if device_info['WIFICONTROL']:
+            device_info['MOTION'] = True
+            device_info['AMBIENT_LIGHT'] = True
+    hub = CyncHub(user_data, options, lambda: None)
+    hub.writer = NullWriter()
+    return hub
+
+def homes(hub):
+    """(home_id, controller switch id, mesh indexes of its switches) of every home"""
+    return [(home_id, int(controllers[0]), [mesh_index for mesh_index, device_id in hub.home_devices[home_id].items() if device_id in hub.cync_switches and mesh_index < 256])
+        for home_id, controllers in hub.home_controllers.items()]
+
+def initial_dumps(hub, rng):
+    frames = []
+    for cycle in range(50):
+        state = cycle % 2
+        for home_id, switch_id, mesh_indexes in homes(hub):
+            records = [INITIAL_STATE_RECORD.pack(mesh_index, state, rng.randint(1, 100) if state else 0, rng.randint(0, 100), 0, 0, 0) for mesh_index in mesh_indexes]
+            for start in range(0, len(records), DUMP_RECORDS):
+                header = bytearray(22)
+                PACKET_HEADER.pack_into(header, 0, switch_id, len(frames))
+                header[13] = 82
+                chunk = b''.join(records[start:start + DUMP_RECORDS])
+                frames.append(frame(0x73, bytes(header) + chunk + b'\x7e'*max(1, 52 - len(header) - len(chunk))))
+    return frames
+
+def device_state_bursts(hub, rng, count=2000, records=10):
+    home_info = homes(hub)
+    frames = []
+    for _ in range(count):
+        home_id, switch_id, mesh_indexes = rng.choice(home_info)
+        packet = SWITCH_ID.pack(switch_id) + bytes([1, 1, 6]) + b''.join([DEVICE_STATE_RECORD.pack(mesh_index, 1, rng.randint(1, 100), 254, rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)) for mesh_index in rng.sample(mesh_indexes, records)])
+        frames.append(frame(0x43, packet))
+    return frames
+
+def motion_flood(hub, rng, count=10000):
+    sensors = [(int(hub.home_controllers[home_id][0]), mesh_index) for home_id, mesh in hub.home_devices.items() for mesh_index, device_id in mesh.items() if device_id in hub.cync_motion_sensors and mesh_index < 256]
+    frames = []
+    for response_id in range(count):
+        switch_id, mesh_index = rng.choice(sensors)
+        packet = bytearray(25)
+        PACKET_HEADER.pack_into(packet, 0, switch_id, response_id % 65536)
+        packet[13] = 84
+        packet[16] = mesh_index
+        packet[22] = response_id % 2
+        packet[24] = rng.randint(0, 1)
+        frames.append(frame(0x73, bytes(packet)))
+    return frames
+
+def acks(hub, rng, count=10000):
+    switch_ids = [int(switch_id) for switch_id in hub.switchID_to_homeID]
+    return [frame(123, struct.pack(">IHB", rng.choice(switch_ids), seq % 65536, 0)) for seq in range(count)]
+
+def mixed(streams):
+    frames = [data for stream in streams.values() for data in stream]
+    random.Random(1).shuffle(frames)
+    return frames
+
+def reads(frames):
+    """Cut the byte stream of frames into reads the size of a TCP segment"""
+    data = b''.join(frames)
+    return [data[start:start + READ_SIZE] for start in range(0, len(data), READ_SIZE)]
+
+def replay(hub, chunks):
+    hub._frame_reader = CyncFrameReader()
+    for chunk in chunks:
+        hub._process_data(chunk)
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values)*fraction))]
+
+def measure(hub, frames):
+    chunks = reads(frames)
+    throughput = len(frames)/min(timeit.repeat(lambda: replay(hub, chunks), number=1, repeat=5))
+    hub._frame_reader = CyncFrameReader()
+    latencies = []
+    clock = time.perf_counter_ns
+    for data in frames:
+        start = clock()
+        hub._process_data(data)
+        latencies.append(clock() - start)
+    latencies.sort()
+    tracemalloc.start()
+    replay(hub, chunks)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'frames': len(frames), 'frames_per_sec': throughput, 'p50_us': percentile(latencies, 0.5)/1000, 'p90_us': percentile(latencies, 0.9)/1000,
+        'p99_us': percentile(latencies, 0.99)/1000, 'max_us': latencies[-1]/1000, 'peak_kib': peak/1024, 'retained_kib': retained/1024}
+
+def measure_capture(path):
+    """Decode the inbound frames of a capture file, they are copied out of the memory map once so timing excludes disk reads"""
+    with CaptureFile(path) as capture_file:
+        frames = [(packet_type, bytes(packet)) for timestamp, packet_type, packet in capture_file.frames()]
+    views = [(packet_type, memoryview(packet)) for packet_type, packet in frames]
+    if not views:
+        print(f"{path} has no inbound frames")
+        return
+    def decode():
+        for packet_type, packet in views:
+            decode_frame(packet_type, packet)
+    throughput = len(views)/min(timeit.repeat(decode, number=1, repeat=5))
+    latencies = []
+    clock = time.perf_counter_ns
+    for packet_type, packet in views:
+        start = clock()
+        decode_frame(packet_type, packet)
+        latencies.append(clock() - start)
+    latencies.sort()
+    print(f"{len(views)} frames from {path}: {throughput:,.0f} frames/sec, p50 {percentile(latencies, 0.5)/1000:.1f} us, p99 {percentile(latencies, 0.99)/1000:.1f} us, max {latencies[-1]/1000:.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare frames/sec against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed frames/sec drop for --compare, default 0.2")
+    parser.add_argument("--capture", help="decode the inbound frames of this capture file")
+    args = parser.parse_args()
+    if args.capture:
+        measure_capture(args.capture)
+        return
+
+    hub = make_hub()
+    rng = random.Random(0)
+    streams = {
+        "initial dumps": initial_dumps(hub, rng),
+        "type 67 bursts": device_state_bursts(hub, rng),
+        "motion flood": motion_flood(hub, rng),
+        "acks": acks(hub, rng),
+    }
+    streams["mixed"] = mixed(streams)
+
+    results = {}
+    print(f"{'stream':>15} {'frames':>7} {'frames/sec':>12} {'p50 us':>8} {'p90 us':>8} {'p99 us':>8} {'max us':>9} {'peak KiB':>9} {'kept KiB':>9}")
+    for name, frames in streams.items():
+        result = results[name] = measure(hub, frames)
+        print(f"{name:>15} {result['frames']:>7} {result['frames_per_sec']:>12,.0f} {result['p50_us']:>8.1f} {result['p90_us']:>8.1f} {result['p99_us']:>8.1f} {result['max_us']:>9.1f} {result['peak_kib']:>9.1f} {result['retained_kib']:>9.1f}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = [name for name, result in results.items() if name in baseline and result['frames_per_sec'] < baseline[name]['frames_per_sec']*(1 - args.tolerance)]
+        for name in regressions:
+            print(f"regression in {name}: {results[name]['frames_per_sec']:,.0f} frames/sec, baseline {baseline[name]['frames_per_sec']:,.0f}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
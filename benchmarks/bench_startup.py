@@ -0,0 +1,27 @@
+"""Measure CyncHub construction time for growing synthetic configurations, up to 5,000 devices.
+
+Run from the repository root with Home Assistant installed:
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from custom_components.cync_lights.cync_hub import CyncHub
+from synthetic import make_user_data
+
+def main():
+    for device_count in (500, 1000, 2000, 5000):
+        user_data, options = make_user_data(device_count, homes=2)
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            CyncHub(user_data, options, lambda: None)
+            best = min(best, time.perf_counter() - start)
+        print(f"{device_count:>6} devices: {best*1000:8.1f} ms ({best*1e6/device_count:6.1f} us/device)")
+
+if __name__ == "__main__":
+    main()
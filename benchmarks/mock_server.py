@@ -0,0 +1,173 @@
+"""Local stand-in for the Cync TCP server, for testing and benchmarking CyncHub without the Cync cloud.
+
+Import it from scripts that put the repository root on sys.path, like the benchmarks do.
+"""
+import asyncio
+import random
+import struct
+from custom_components.cync_lights.cync_hub import CyncFrameReader, FRAME_HEADER, PACKET_HEADER, SWITCH_ID, INITIAL_STATE_RECORD, DEVICE_STATE_RECORD, build_mesh_indexes
+
+COMMAND_ACK = struct.Struct(">IHB")
+MAX_DUMP_RECORDS = 256
+
+def frame(packet_type, packet):
+    return FRAME_HEADER.pack(packet_type, len(packet)) + packet
+
+class MockCyncServer:
+    """Asyncio server speaking the framing CyncHub uses, backed by the devices and rooms of a cync_config.
+
+    It answers the login, 0xd3 heartbeats, 0xa3 pings of known controllers with 0xab replies, and 0x73 requests with
+    type 123 acks. State requests are answered with subtype 82 state dumps, and power, color temperature and combo
+    commands update the simulated devices and echo their new state in a 0x43 frame. Replies are delayed by latency
+    seconds and dropped with probability loss. Controllers in unresponsive never answer.
+
+    Commands are matched to a room by their group id first, so rooms and devices of a home should not share mesh ids.
+    Point a hub at it with CyncHub(..., host = '127.0.0.1', port = server.port, tls = False).
+    """
+
+    def __init__(self, cync_config, latency = 0.0, loss = 0.0, seed = None):
+        self.latency = latency
+        self.loss = loss
+        self.unresponsive = set()
+        self.frames_received = 0
+        self.commands_received = 0
+        self._random = random.Random(seed)
+        self._server = None
+        self._writers = set()
+        self.switchID_to_homeID = cync_config['switchID_to_homeID']
+        self.home_devices, self.device_homes, _ = build_mesh_indexes(cync_config['home_devices'], cync_config['devices'])
+        #the mesh index state records address each device by, devices beyond the first 256 indexes of a home have none
+        self.mesh_indexes = {}
+        for home_devices in self.home_devices.values():
+            for mesh_index, device_id in home_devices.items():
+                if mesh_index < 256:
+                    self.mesh_indexes.setdefault(device_id, mesh_index)
+        #[power state, brightness, color temp, r, g, b] of every switch
+        self.states = {device_id:[False, 0, 0, 0, 0, 0] for device_id, device_info in cync_config['devices'].items() if device_info.get('ONOFF',False)}
+        self.room_devices = {}
+        for room_id, room_info in cync_config['rooms'].items():
+            home_id = room_id.split('-')[0]
+            switches = list(room_info.get('switches',[]))
+            for subgroup in room_info.get('subgroups',[]):
+                switches += cync_config['rooms'].get(subgroup, {}).get('switches',[])
+            self.room_devices[(home_id, int(room_info.get('mesh_id',0)))] = switches
+
+    async def start(self, host = '127.0.0.1', port = 0):
+        """Start listening, port 0 picks a free port"""
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def set_state(self, device_id, state, brightness, color_temp = 0, rgb = (0, 0, 0)):
+        """Change a device as if it was switched locally and push the new state to every connected hub"""
+        self.states[device_id] = [state, brightness if state else 0, color_temp, *rgb]
+        home_id = self.device_homes[device_id]
+        controller = next((switch_id for switch_id, home in self.switchID_to_homeID.items() if home == home_id), None)
+        if controller is not None:
+            for writer in list(self._writers):
+                self._send(writer, [self._device_states_frame(int(controller), [device_id])])
+
+    async def _handle_connection(self, reader, writer):
+        self._writers.add(writer)
+        frame_reader = CyncFrameReader()
+        try:
+            while data := await reader.read(65536):
+                frame_reader.feed(data)
+                for packet_type, packet in frame_reader.frames():
+                    self.frames_received += 1
+                    self._handle_frame(writer, packet_type, bytes(packet))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _handle_frame(self, writer, packet_type, packet):
+        if packet_type == 0x13:
+            self._send(writer, [frame(0x18, b'\x00\x00')], lossy = False)
+        elif packet_type == 0xd3:
+            self._send(writer, [frame(0xd8, b'')], lossy = False)
+        elif packet_type == 0xa3 and len(packet) >= SWITCH_ID.size:
+            controller = SWITCH_ID.unpack_from(packet)[0]
+            if str(controller) in self.switchID_to_homeID and str(controller) not in self.unresponsive:
+                self._send(writer, [frame(0xab, SWITCH_ID.pack(controller) + b'\x00\x00\x00')])
+        elif packet_type == 0x73 and len(packet) > 13:
+            #7 byte 0x73 frames are the hub's responses to pushed frames and are not answered
+            switch_id, seq = PACKET_HEADER.unpack_from(packet)
+            home_id = self.switchID_to_homeID.get(str(switch_id))
+            if home_id is None or str(switch_id) in self.unresponsive:
+                return
+            frames = [frame(123, COMMAND_ACK.pack(switch_id, seq, 0))]
+            subtype = packet[13]
+            if subtype == 82:
+                frames += self._state_dump_frames(switch_id, seq, home_id)
+            elif subtype in (0xd0, 0xe2, 0xf0) and len(packet) > 27:
+                self.commands_received += 1
+                frames.append(self._device_states_frame(switch_id, self._apply_command(home_id, subtype, packet)))
+            self._send(writer, frames)
+
+    def _apply_command(self, home_id, subtype, packet):
+        """Update the devices addressed by a command and return their ids"""
+        mesh_id = int.from_bytes(packet[21:23], 'little')
+        device_ids = self.room_devices.get((home_id, mesh_id)) or [self.home_devices[home_id].get(mesh_id)]
+        device_ids = [device_id for device_id in device_ids if device_id in self.states]
+        for device_id in device_ids:
+            state = self.states[device_id]
+            if subtype == 0xd0:
+                state[0] = packet[26] > 0
+                if state[0] and state[1] == 0:
+                    state[1] = 100
+            elif subtype == 0xe2:
+                state[2] = packet[27]
+            else:
+                state[0] = packet[26] > 0
+                state[1] = packet[27]
+                if packet[28] == 254:
+                    state[2:6] = [254, packet[29], packet[30], packet[31]]
+                elif packet[28] != 255:
+                    state[2] = packet[28]
+        return device_ids
+
+    def _records(self, device_ids):
+        for device_id in device_ids:
+            mesh_index = self.mesh_indexes.get(device_id)
+            if mesh_index is not None:
+                state, brightness, color_temp, r, g, b = self.states[device_id]
+                yield mesh_index, 1 if state else 0, brightness if state else 0, color_temp, r, g, b
+
+    def _state_dump_frames(self, switch_id, seq, home_id):
+        records = [INITIAL_STATE_RECORD.pack(*record) for record in self._records([device_id for mesh_index, device_id in sorted(self.home_devices[home_id].items()) if device_id in self.states])]
+        frames = []
+        for start in range(0, len(records), MAX_DUMP_RECORDS):
+            header = bytearray(22)
+            PACKET_HEADER.pack_into(header, 0, switch_id, seq)
+            header[13] = 82
+            chunk = b''.join(records[start:start + MAX_DUMP_RECORDS])
+            #the hub ignores the partial record at the end of a dump
+            frames.append(frame(0x73, bytes(header) + chunk + b'\x7e'*max(1, 52 - len(header) - len(chunk))))
+        return frames
+
+    def _device_states_frame(self, switch_id, device_ids):
+        return frame(0x43, SWITCH_ID.pack(switch_id) + bytes([1, 1, 6]) + b''.join([DEVICE_STATE_RECORD.pack(*record) for record in self._records(device_ids)]))
+
+    def _send(self, writer, frames, lossy = True):
+        if lossy and self.loss > 0 and self._random.random() < self.loss:
+            return
+        data = b''.join(frames)
+        if self.latency > 0:
+            asyncio.get_running_loop().call_later(self.latency, self._write, writer, data)
+        else:
+            self._write(writer, data)
+
+    def _write(self, writer, data):
+        if not writer.is_closing():
+            writer.write(data)
@@ -0,0 +1,56 @@
+"""Synthetic Cync configurations shaped like the output of CyncUserData.get_cync_config."""
+
+def make_user_data(device_count, homes=1, devices_per_room=10, controller_every=3):
+    """Return (user_data, options) for a config entry with device_count devices spread over homes.
+
+    Every controller_every-th device is a Wi-Fi controller, rooms hold devices_per_room devices and the first two
+    devices of every room also form a subgroup of that room. Rooms and subgroups get mesh ids after the last device
+    of their home so that group commands can be told apart from device commands.
+    """
+    devices = {}
+    rooms = {}
+    home_devices = {}
+    home_controllers = {}
+    switch_to_home = {}
+    per_home = -(-device_count // homes)
+    next_switch_id = 100000
+    for home in range(homes):
+        home_id = str(1000 + home)
+        count = min(per_home, device_count - home*per_home)
+        mesh = [""]*(count + 1)
+        home_controllers[home_id] = []
+        for mesh_index in range(1, count + 1):
+            device_id = str(int(home_id)*100000 + mesh_index)
+            mesh[mesh_index] = device_id
+            is_controller = mesh_index % controller_every == 1
+            devices[device_id] = {'name': f'Light {mesh_index}', 'mesh_id': mesh_index, 'switch_id': '0',
+                'ONOFF': True, 'BRIGHTNESS': True, 'COLORTEMP': mesh_index % 2 == 0, 'RGB': mesh_index % 4 == 0,
+                'MOTION': False, 'AMBIENT_LIGHT': False, 'WIFICONTROL': is_controller, 'PLUG': False, 'FAN': False,
+                'home_name': f'Home {home}', 'room': '', 'room_name': ''}
+            if is_controller:
+                next_switch_id += 1
+                devices[device_id]['switch_id'] = str(next_switch_id)
+                devices[device_id]['switch_controller'] = next_switch_id
+                home_controllers[home_id].append(next_switch_id)
+                switch_to_home[str(next_switch_id)] = home_id
+        home_devices[home_id] = mesh
+        room_count = -(-count // devices_per_room)
+        for room in range(room_count):
+            room_id = f'{home_id}-{room + 1}'
+            switches = mesh[1 + room*devices_per_room:1 + min(count, (room + 1)*devices_per_room)]
+            subgroup_id = f'{home_id}-{room_count + room + 1}'
+            rooms[room_id] = {'name': f'Room {room}', 'mesh_id': count + room + 1, 'room_controller': home_controllers[home_id][0],
+                'home_name': f'Home {home}', 'switches': switches[2:], 'isSubgroup': False, 'subgroups': [subgroup_id]}
+            rooms[subgroup_id] = {'name': f'Group {room}', 'mesh_id': count + room_count + room + 1, 'room_controller': home_controllers[home_id][0],
+                'home_name': f'Home {home}', 'switches': switches[:2], 'isSubgroup': True, 'subgroups': [], 'parent_room': f'Room {room}'}
+            for device_id in switches:
+                devices[device_id]['room'] = room_id
+                devices[device_id]['room_name'] = f'Room {room}'
+                devices[device_id].setdefault('switch_controller', home_controllers[home_id][0])
+    user_data = {'cync_credentials': list(b'\x13\x00\x00\x00\x00'),
+        'cync_config': {'rooms': rooms, 'devices': devices, 'home_devices': home_devices,
+            'home_controllers': home_controllers, 'switchID_to_homeID': switch_to_home}}
+    options = {'rooms': [room_id for room_id, room in rooms.items() if not room['isSubgroup']],
+        'subgroups': [room_id for room_id, room in rooms.items() if room['isSubgroup']],
+        'switches': list(devices), 'motion_sensors': [], 'ambient_light_sensors': []}
+    return user_data, options
@@ -1,29 +1,249 @@
 """The Cync Room Lights integration."""
 from __future__ import annotations
-
+import asyncio
+import logging
+import voluptuous as vol
+from homeassistant.components.light import ATTR_BRIGHTNESS, ATTR_COLOR_TEMP, ATTR_RGB_COLOR
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from .const import DOMAIN
-from .cync_hub import CyncHub
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, entity_registry as er
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_call_later, async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.typing import ConfigType
+from homeassistant.util import dt as dt_util
+from .capture import FrameCapture
+from .const import CONFIG_REFRESH_INTERVAL, DOMAIN, SERVICE_BULK_SET, SERVICE_PROFILE, SERVICE_START_CAPTURE, SERVICE_STOP_CAPTURE, STORAGE_SAVE_DELAY, STORAGE_VERSION
+from .cync_hub import AccessTokenExpired, CyncHub, CyncUserData, MAX_MIREDS, MIN_MIREDS, MIN_UPDATE_INTERVAL
+from .profiling import LoopProfiler
+
+_LOGGER = logging.getLogger(__name__)
+
+PLATFORMS: list[str] = ["light","binary_sensor","switch","fan","sensor"]
+
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+BULK_SET_SCHEMA = vol.Schema(
+    {
+        vol.Required("targets"): vol.All(cv.ensure_list, [vol.Schema(
+            {
+                vol.Required(ATTR_ENTITY_ID): cv.entity_id,
+                vol.Optional("state", default=True): cv.boolean,
+                vol.Optional(ATTR_BRIGHTNESS): vol.All(vol.Coerce(int), vol.Range(min=0, max=255)),
+                vol.Optional(ATTR_COLOR_TEMP): vol.All(vol.Coerce(int), vol.Range(min=MIN_MIREDS, max=MAX_MIREDS)),
+                vol.Optional(ATTR_RGB_COLOR): vol.All(vol.ExactSequence((cv.byte, cv.byte, cv.byte)), vol.Coerce(list)),
+            }
+        )]),
+    }
+)
+
+START_CAPTURE_SCHEMA = vol.Schema(
+    {
+        vol.Optional("duration"): vol.All(vol.Coerce(int), vol.Range(min=1)),
+        vol.Optional("max_size", default=100): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    }
+)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional("duration", default=60): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+        vol.Optional("tracemalloc", default=False): cv.boolean,
+    }
+)
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the Cync Room Lights services."""
+
+    async def async_bulk_set(call: ServiceCall) -> ServiceResponse:
+        """Set the state of several Cync switches and rooms at once."""
+        registry = er.async_get(hass)
+        hub_commands = {}
+        for target in call.data["targets"]:
+            entity_id = target[ATTR_ENTITY_ID]
+            entry = registry.async_get(entity_id)
+            hub = hass.data.get(DOMAIN, {}).get(entry.config_entry_id) if entry else None
+            cync_target = hub.find_target(entry.unique_id) if hub else None
+            if cync_target is None:
+                raise HomeAssistantError(f"{entity_id} is not a Cync light, switch, fan or room")
+            if getattr(cync_target, "plug", False):
+                command = (cync_target, target["state"], None, None, None)
+            else:
+                command = (cync_target, target["state"], target.get(ATTR_RGB_COLOR), target.get(ATTR_BRIGHTNESS), target.get(ATTR_COLOR_TEMP))
+            hub_commands.setdefault(hub, []).append((entity_id, command))
+
+        hubs = list(hub_commands)
+        hub_results = await asyncio.gather(*(hub.bulk_set([command for entity_id, command in hub_commands[hub]]) for hub in hubs))
+        results = {}
+        for hub, hub_result in zip(hubs, hub_results):
+            for (entity_id, command), result in zip(hub_commands[hub], hub_result):
+                results[entity_id] = result
+        return {"results": results}
+
+    hass.services.async_register(DOMAIN, SERVICE_BULK_SET, async_bulk_set, schema=BULK_SET_SCHEMA, supports_response=SupportsResponse.OPTIONAL)
+
+    async def async_start_capture(call: ServiceCall) -> ServiceResponse:
+        """Record the traffic of every Cync hub to a capture file in the configuration directory."""
+        files = []
+        for entry_id, hub in hass.data.get(DOMAIN, {}).items():
+            stop_capture(hub)
+            path = hass.config.path(f"{DOMAIN}_capture_{entry_id}_{dt_util.now().strftime('%Y%m%d_%H%M%S')}.bin")
+            hub.capture = FrameCapture(path, call.data["max_size"]*1024*1024)
+            if "duration" in call.data:
+                async_call_later(hass, call.data["duration"], capture_stopper(hub, hub.capture))
+            files.append(path)
+        return {"files": files}
+
+    async def async_stop_capture(call: ServiceCall) -> None:
+        """Stop recording the traffic of every Cync hub."""
+        for hub in hass.data.get(DOMAIN, {}).values():
+            stop_capture(hub)
+
+    hass.services.async_register(DOMAIN, SERVICE_START_CAPTURE, async_start_capture, schema=START_CAPTURE_SCHEMA, supports_response=SupportsResponse.OPTIONAL)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_CAPTURE, async_stop_capture)
+
+    profile_lock = asyncio.Lock()
+
+    async def async_profile(call: ServiceCall) -> ServiceResponse:
+        """Profile the event loop, where the Cync hubs read, update and send, and write the results to the configuration directory."""
+        if profile_lock.locked():
+            raise HomeAssistantError("A Cync profile is already running")
+        async with profile_lock:
+            profiler = LoopProfiler(call.data["tracemalloc"])
+            profiler.start()
+            try:
+                await asyncio.sleep(call.data["duration"])
+            finally:
+                profiler.stop()
+            name = hass.config.path(f"{DOMAIN}_profile_{dt_util.now().strftime('%Y%m%d_%H%M%S')}")
+            files = {"pstats": name + ".pstats", "allocations": name + "_allocations.txt" if call.data["tracemalloc"] else None}
+            await hass.async_add_executor_job(profiler.write, files["pstats"], files["allocations"])
+        return files
+
+    hass.services.async_register(DOMAIN, SERVICE_PROFILE, async_profile, schema=PROFILE_SCHEMA, supports_response=SupportsResponse.OPTIONAL)
+
+    return True
+
+def stop_capture(hub, capture = None) -> None:
+    """Stop the running capture of a hub, or only the given capture if it is still running"""
+    if hub.capture is not None and (capture is None or hub.capture is capture):
+        hub.capture.close()
+        hub.capture = None
+
+def capture_stopper(hub, capture):
+    return lambda now: stop_capture(hub, capture)
+
+def snapshot_saver(store, snapshot):
+    """Return a state_changed callback that saves the snapshot STORAGE_SAVE_DELAY seconds after the first change since the last save.
+
+    Later changes do not postpone the save, as calling async_delay_save for every change would while state keeps changing.
+    """
+    save_pending = False
 
-PLATFORMS: list[str] = ["light","binary_sensor","switch","fan"]
+    def data_func():
+        nonlocal save_pending
+        save_pending = False
+        return snapshot()
+
+    def state_changed():
+        nonlocal save_pending
+        if not save_pending:
+            save_pending = True
+            store.async_delay_save(data_func, STORAGE_SAVE_DELAY)
+
+    return state_changed
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Cync Room Lights from a config entry."""
 
     hass.data.setdefault(DOMAIN, {})
     remove_options_update_listener = entry.add_update_listener(options_update_listener)
-    hub = CyncHub(entry.data, entry.options, remove_options_update_listener)
+    store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}")
+    snapshot = await store.async_load()
+    hub = CyncHub(entry.data, entry.options, remove_options_update_listener, snapshot=snapshot, state_changed=snapshot_saver(store, lambda: hub.snapshot()), min_update_interval=entry.options.get("min_update_interval", MIN_UPDATE_INTERVAL))
+
+    async def async_save_snapshot() -> None:
+        await store.async_save(hub.snapshot())
+
+    entry.async_on_unload(async_save_snapshot)
     hass.data[DOMAIN][entry.entry_id] = hub
-    hub.start_tcp_client()
+    hub.start_tcp_client(lambda coro: entry.async_create_background_task(hass, coro, "Cync TCP Client"))
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    async def async_refresh(now) -> None:
+        if not await async_refresh_config(hass, entry):
+            #refreshing again needs new credentials, re-authenticating reloads the entry which restarts the refresh
+            stop_refresh()
+
+    stop_refresh = async_track_time_interval(hass, async_refresh, CONFIG_REFRESH_INTERVAL)
+    entry.async_on_unload(stop_refresh)
+
+    return True
+
+def refreshed_options(options, old_config, new_config) -> dict:
+    """Drop selections that no longer exist and select new rooms and devices the way the config flow does by default"""
+    rooms = new_config["rooms"]
+    devices = new_config["devices"]
+    new_rooms = [room_id for room_id in rooms if room_id not in old_config["rooms"]]
+    new_devices = [device_id for device_id in devices if device_id not in old_config["devices"]]
+    return {
+        **options,
+        "rooms": [room_id for room_id in options.get("rooms", []) if room_id in rooms] + [room_id for room_id in new_rooms if not rooms[room_id]["isSubgroup"]],
+        "subgroups": [room_id for room_id in options.get("subgroups", []) if room_id in rooms] + [room_id for room_id in new_rooms if rooms[room_id]["isSubgroup"]],
+        "switches": [device_id for device_id in options.get("switches", []) if device_id in devices] + [device_id for device_id in new_devices if devices[device_id]["FAN"]],
+        "motion_sensors": [device_id for device_id in options.get("motion_sensors", []) if device_id in devices] + [device_id for device_id in new_devices if devices[device_id]["MOTION"]],
+        "ambient_light_sensors": [device_id for device_id in options.get("ambient_light_sensors", []) if device_id in devices] + [device_id for device_id in new_devices if devices[device_id]["AMBIENT_LIGHT"]],
+    }
+
+async def async_refresh_config(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Fetch the Cync config again and apply changed devices and rooms to the running hub without a reload.
+
+    The access token of the last login is reused until the Cync API rejects it, then the stored password is used to log
+    in again. Returns False when that login fails too, the user has to re-authenticate before the config can be refreshed.
+    """
+    hub = hass.data[DOMAIN][entry.entry_id]
+    user_data = CyncUserData(async_get_clientsession(hass))
+    try:
+        try:
+            if "cync_user_credentials" not in entry.data:
+                raise AccessTokenExpired
+            user_data.use_credentials(entry.data["cync_user_credentials"])
+            cync_config = await user_data.get_cync_config()
+        except AccessTokenExpired:
+            response = await user_data.authenticate(entry.data["user_input"]["username"], entry.data["user_input"]["password"], request_two_factor_code=False)
+            if not response["authorized"]:
+                _LOGGER.warning("Cync config refresh stopped, re-authenticate the Cync account to resume it")
+                entry.async_start_reauth(hass)
+                return False
+            cync_config = await user_data.get_cync_config()
+    except Exception as e:
+        _LOGGER.error(str(type(e).__name__) + ": " + str(e))
+        return True
+    if cync_config == entry.data["cync_config"] and user_data.user_credentials == entry.data.get("cync_user_credentials"):
+        return True
+
+    data = {**entry.data, "cync_credentials": user_data.auth_code, "cync_user_credentials": user_data.user_credentials, "cync_config": cync_config}
+    options = refreshed_options(entry.options, entry.data["cync_config"], cync_config)
+    removed = hub.update_config(data, options)
+    #the hub already holds this data and options, so options_update_listener does not reload the entry
+    hass.config_entries.async_update_entry(entry, data=data, options=options)
+    registry = er.async_get(hass)
+    for unique_id in removed:
+        for platform in PLATFORMS:
+            if entity_id := registry.async_get_entity_id(platform, DOMAIN, unique_id):
+                registry.async_remove(entity_id)
+    for add_new_entities in hub.entity_adders:
+        add_new_entities()
     return True
 
 async def options_update_listener(
     hass: HomeAssistant, config_entry: config_entries.ConfigEntry
 ):
-    """Handle options update."""
+    """Handle options update, reloading only for changes the hub has not applied itself."""
+    hub = hass.data[DOMAIN].get(config_entry.entry_id)
+    if hub is not None and config_entry.data == hub.user_data and config_entry.options == hub.options:
+        return
     await hass.config_entries.async_reload(config_entry.entry_id)
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -31,8 +251,13 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hub = hass.data[DOMAIN][entry.entry_id]
     hub.remove_options_update_listener()
     hub.disconnect()
+    stop_capture(hub)
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
 
     return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the state snapshot of a deleted config entry."""
+    await Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}").async_remove()
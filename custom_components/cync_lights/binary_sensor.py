@@ -1,6 +1,5 @@
 """Platform for binary sensor integration."""
 from __future__ import annotations
-from typing import Any
 from homeassistant.components.binary_sensor import (BinarySensorDeviceClass, BinarySensorEntity)
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
@@ -15,16 +14,20 @@ async def async_setup_entry(
 ) -> None:
     hub = hass.data[DOMAIN][config_entry.entry_id]
 
-    new_devices = []
-    for sensor in hub.cync_motion_sensors:
-        if not hub.cync_motion_sensors[sensor]._update_callback and sensor in config_entry.options["motion_sensors"]:
-            new_devices.append(CyncMotionSensorEntity(hub.cync_motion_sensors[sensor]))
-    for sensor in hub.cync_ambient_light_sensors:
-        if not hub.cync_ambient_light_sensors[sensor]._update_callback and sensor in config_entry.options["ambient_light_sensors"]:
-            new_devices.append(CyncAmbientLightSensorEntity(hub.cync_ambient_light_sensors[sensor]))
+    def add_new_entities() -> None:
+        new_devices = []
+        for sensor in hub.cync_motion_sensors:
+            if not hub.cync_motion_sensors[sensor]._update_callback and sensor in config_entry.options["motion_sensors"]:
+                new_devices.append(CyncMotionSensorEntity(hub.cync_motion_sensors[sensor]))
+        for sensor in hub.cync_ambient_light_sensors:
+            if not hub.cync_ambient_light_sensors[sensor]._update_callback and sensor in config_entry.options["ambient_light_sensors"]:
+                new_devices.append(CyncAmbientLightSensorEntity(hub.cync_ambient_light_sensors[sensor]))
 
-    if new_devices:
-        async_add_entities(new_devices)
+        if new_devices:
+            async_add_entities(new_devices)
+
+    hub.entity_adders.append(add_new_entities)
+    add_new_entities()
 
 
 class CyncMotionSensorEntity(BinarySensorEntity):
@@ -38,7 +41,7 @@ class CyncMotionSensorEntity(BinarySensorEntity):
 
     async def async_added_to_hass(self) -> None:
         """Run when this Entity has been added to HA."""
-        self.motion_sensor.register(self.schedule_update_ha_state)
+        self.motion_sensor.register(self.async_write_ha_state)
 
     async def async_will_remove_from_hass(self) -> None:
         """Entity being removed from hass."""
@@ -85,7 +88,7 @@ class CyncAmbientLightSensorEntity(BinarySensorEntity):
 
     async def async_added_to_hass(self) -> None:
         """Run when this Entity has been added to HA."""
-        self.ambient_light_sensor.register(self.schedule_update_ha_state)
+        self.ambient_light_sensor.register(self.async_write_ha_state)
 
     async def async_will_remove_from_hass(self) -> None:
         """Entity being removed from hass."""
@@ -0,0 +1,158 @@
+"""Capture the traffic between CyncHub and the Cync server to a binary log and replay it from a memory map."""
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+from typing import NamedTuple
+from .cync_hub import CAPTURE_INBOUND, CyncFrameReader
+
+_LOGGER = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b'CYNCCAP1'
+# (timestamp, direction, length), followed by length bytes of data
+CAPTURE_RECORD = struct.Struct('<dBI')
+
+class CaptureRecord(NamedTuple):
+    timestamp: float
+    direction: int
+    data: memoryview
+
+class FrameCapture:
+    """Append the data read from and written to the Cync server to a capture file.
+
+    Records hold the bytes exactly as they were read or written, so frames split across reads replay the same way.
+    record() only queues the data, a writer thread opens the file and writes it so the read loop never waits for the
+    disk. Recording stops once the file would grow beyond max_bytes.
+    """
+
+    def __init__(self, path, max_bytes = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.closed = False
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target = self._write_records, name = "Cync Capture", daemon = True)
+        self._thread.start()
+
+    def record(self, direction, data):
+        if not self.closed:
+            self._queue.put((time.time(), direction, bytes(data)))
+
+    def close(self, wait = False):
+        """Stop recording, records queued before are still written. With wait, block until the file is closed"""
+        if not self.closed:
+            self.closed = True
+            self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _write_records(self):
+        try:
+            with open(self.path, 'wb') as file:
+                file.write(CAPTURE_MAGIC)
+                self.size = len(CAPTURE_MAGIC)
+                stopped = False
+                while not stopped:
+                    items = [self._queue.get()]
+                    while not self._queue.empty():
+                        items.append(self._queue.get_nowait())
+                    chunks = []
+                    for item in items:
+                        if item is None:
+                            stopped = True
+                            break
+                        timestamp, direction, data = item
+                        if self.max_bytes is not None and self.size + CAPTURE_RECORD.size + len(data) > self.max_bytes:
+                            _LOGGER.warning("Cync capture " + self.path + " reached its maximum size, recording stopped")
+                            self.closed = True
+                            stopped = True
+                            break
+                        chunks.append(CAPTURE_RECORD.pack(timestamp, direction, len(data)))
+                        chunks.append(data)
+                        self.size += CAPTURE_RECORD.size + len(data)
+                    file.write(b''.join(chunks))
+                    file.flush()
+        except Exception as e:
+            self.closed = True
+            _LOGGER.error(str(type(e).__name__) + ": " + str(e))
+
+class CaptureFile:
+    """Memory-mapped capture file, records are read from the map and never loaded into RAM as a whole.
+
+    The data of a record is a memoryview into the map and is only valid until the next record is requested.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise InvalidCaptureFile(path + " is empty")
+        self._view = memoryview(self._map)
+        #record views handed out by iterations that have not finished, the map can only be closed once they are released
+        self._records = set()
+        if self._map[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            self.close()
+            raise InvalidCaptureFile(path + " is not a Cync capture file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for record in self._records:
+            record.release()
+        self._records.clear()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __iter__(self):
+        """Yield a CaptureRecord for every complete record, a truncated record at the end of the file is skipped"""
+        view = self._view
+        end = len(view)
+        offset = len(CAPTURE_MAGIC)
+        while offset + CAPTURE_RECORD.size <= end:
+            timestamp, direction, length = CAPTURE_RECORD.unpack_from(view, offset)
+            offset += CAPTURE_RECORD.size
+            if offset + length > end:
+                break
+            data = view[offset:offset + length]
+            self._records.add(data)
+            try:
+                yield CaptureRecord(timestamp, direction, data)
+            finally:
+                self._records.discard(data)
+                data.release()
+            offset += length
+
+    def frames(self, direction = CAPTURE_INBOUND):
+        """Yield (timestamp, packet_type, packet) for every frame sent in one direction, reassembled like CyncHub reads them"""
+        frame_reader = CyncFrameReader()
+        for record in self:
+            if record.direction == direction:
+                frame_reader.feed(record.data)
+                for packet_type, packet in frame_reader.frames():
+                    yield record.timestamp, packet_type, packet
+
+def replay_capture(hub, capture_file):
+    """Feed the inbound records of a capture to a hub as if they were read from the Cync server, returns the number of records.
+
+    Responses to pushed frames are written to hub.writer, which has to be set.
+    """
+    hub._frame_reader = CyncFrameReader()
+    count = 0
+    for record in capture_file:
+        if record.direction == CAPTURE_INBOUND:
+            hub._process_data(record.data)
+            count += 1
+    return count
+
+class InvalidCaptureFile(Exception):
+    """Not a Cync capture file"""
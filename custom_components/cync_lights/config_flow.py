@@ -2,14 +2,17 @@
 from __future__ import annotations
 import logging
 import voluptuous as vol
+from collections.abc import Mapping
 from typing import Any
 from homeassistant import config_entries
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from homeassistant.core import callback
+from . import refreshed_options
 from .const import DOMAIN
-from .cync_hub import CyncUserData
+from .cync_hub import CyncUserData, MIN_UPDATE_INTERVAL
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,6 +22,11 @@ STEP_USER_DATA_SCHEMA = vol.Schema(
         vol.Required("password"): str,       
     }
 )
+STEP_REAUTH_DATA_SCHEMA = vol.Schema(
+    {
+        vol.Required("password"): str,
+    }
+)
 STEP_TWO_FACTOR_CODE = vol.Schema(
     {
         vol.Required("two_factor_code"): str,
@@ -30,7 +38,7 @@ async def cync_login(hub, user_input: dict[str, Any]) -> dict[str, Any]:
 
     response = await hub.authenticate(user_input["username"], user_input["password"])
     if response['authorized']:
-        return {'title':'cync_lights_'+ user_input['username'],'data':{'cync_credentials': hub.auth_code, 'user_input':user_input}}
+        return {'title':'cync_lights_'+ user_input['username'],'data':{'cync_credentials': hub.auth_code, 'cync_user_credentials': hub.user_credentials, 'user_input':user_input}}
     else:
         if response['two_factor_code_required']:
             raise TwoFactorCodeRequired
@@ -42,7 +50,7 @@ async def submit_two_factor_code(hub, user_input: dict[str, Any]) -> dict[str, A
 
     response = await hub.auth_two_factor(user_input["two_factor_code"])
     if response['authorized']:
-        return {'title':'cync_lights_'+ hub.username,'data':{'cync_credentials': hub.auth_code, 'user_input': {'username':hub.username,'password':hub.password}}}
+        return {'title':'cync_lights_'+ hub.username,'data':{'cync_credentials': hub.auth_code, 'cync_user_credentials': hub.user_credentials, 'user_input': {'username':hub.username,'password':hub.password}}}
     else:
         raise InvalidAuth
 
@@ -50,12 +58,57 @@ class CyncConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Cync Room Lights."""
 
     def __init__(self):
-        self.cync_hub = CyncUserData()
+        self._cync_hub = None
         self.data ={}
         self.options = {}
+        self.reauth_entry = None
 
     VERSION = 1
 
+    @property
+    def cync_hub(self) -> CyncUserData:
+        """Cync account client using Home Assistant's shared HTTP session"""
+        if self._cync_hub is None:
+            self._cync_hub = CyncUserData(async_get_clientsession(self.hass))
+        return self._cync_hub
+
+    async def async_step_reauth(
+        self, entry_data: Mapping[str, Any]
+    ) -> FlowResult:
+        """Log in again when the stored Cync credentials are no longer accepted."""
+        self.reauth_entry = self.hass.config_entries.async_get_entry(self.context["entry_id"])
+        return await self.async_step_reauth_confirm()
+
+    async def async_step_reauth_confirm(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Ask for the password of the Cync account of the entry being re-authenticated."""
+        username = self.reauth_entry.data["user_input"]["username"]
+        if user_input is None:
+            return self.async_show_form(
+                step_id="reauth_confirm", data_schema=STEP_REAUTH_DATA_SCHEMA, description_placeholders={"username": username}
+            )
+
+        errors = {}
+
+        try:
+            info = await cync_login(self.cync_hub, {"username": username, "password": user_input["password"]})
+            info["data"]["cync_config"] = await self.cync_hub.get_cync_config()
+        except TwoFactorCodeRequired:
+            return await self.async_step_two_factor_code()
+        except InvalidAuth:
+            errors["base"] = "invalid_auth"
+        except Exception as e:  # pylint: disable=broad-except
+            _LOGGER.error(str(type(e).__name__) + ": " + str(e))
+            errors["base"] = "unknown"
+        else:
+            self.data = info
+            return await self._async_finish_reauth()
+
+        return self.async_show_form(
+            step_id="reauth_confirm", data_schema=STEP_REAUTH_DATA_SCHEMA, description_placeholders={"username": username}, errors=errors
+        )
+
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
@@ -79,7 +132,7 @@ class CyncConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors["base"] = "unknown"
         else:
             self.data = info
-            return await self.async_step_finish_setup()
+            return await self.async_step_select_switches()
 
         return self.async_show_form(
             step_id="user", data_schema=STEP_USER_DATA_SCHEMA, errors=errors
@@ -106,10 +159,12 @@ class CyncConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors["base"] = "unknown"
         else:
             self.data = info
+            if self.reauth_entry is not None:
+                return await self._async_finish_reauth()
             return await self.async_step_select_switches()
 
         return self.async_show_form(
-            step_id="user", data_schema=STEP_USER_DATA_SCHEMA, errors=errors
+            step_id="two_factor_code", data_schema=STEP_TWO_FACTOR_CODE, errors=errors
         )
 
 
@@ -159,7 +214,15 @@ class CyncConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         else:
             self.hass.config_entries.async_update_entry(existing_entry, data=self.data['data'], options=self.options)
             await self.hass.config_entries.async_reload(existing_entry.entry_id)
-            return self.hass.config_entries.async_abort(reason="reauth_successful")
+            return self.async_abort(reason="reauth_successful")
+
+    async def _async_finish_reauth(self) -> FlowResult:
+        """Store the new credentials and Cync config, keeping the selections that still exist, and reload the entry"""
+        entry = self.reauth_entry
+        options = refreshed_options(entry.options, entry.data["cync_config"], self.data["data"]["cync_config"])
+        self.hass.config_entries.async_update_entry(entry, data=self.data["data"], options=options)
+        await self.hass.config_entries.async_reload(entry.entry_id)
+        return self.async_abort(reason="reauth_successful")
 
     @staticmethod
     @callback
@@ -173,9 +236,16 @@ class CyncOptionsFlowHandler(config_entries.OptionsFlow):
     def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
         """Initialize options flow."""
         self.entry = config_entry
-        self.cync_hub = CyncUserData()
+        self._cync_hub = None
         self.data = {}
 
+    @property
+    def cync_hub(self) -> CyncUserData:
+        """Cync account client using Home Assistant's shared HTTP session"""
+        if self._cync_hub is None:
+            self._cync_hub = CyncUserData(async_get_clientsession(self.hass))
+        return self._cync_hub
+
     async def async_step_init(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
@@ -277,6 +347,10 @@ class CyncOptionsFlowHandler(config_entries.OptionsFlow):
                     "ambient_light_sensors",
                     description = {"suggested_value" : [sensor for sensor in self.entry.options["ambient_light_sensors"] if sensor in self.entry.data["cync_config"]["devices"].keys()]},
                 ): cv.multi_select({device_id : f'{device_info["name"]} ({device_info["room_name"]}:{device_info["home_name"]})' for device_id,device_info in self.entry.data["cync_config"]["devices"].items() if device_info.get('AMBIENT_LIGHT',False)}),
+                vol.Optional(
+                    "min_update_interval",
+                    default = self.entry.options.get("min_update_interval", MIN_UPDATE_INTERVAL),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=5)),
             }
         )
 
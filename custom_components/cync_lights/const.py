@@ -1,3 +1,14 @@
 """Constants for the Cync Room Lights integration."""
+from datetime import timedelta
 
-DOMAIN = "cync_lights"
\ No newline at end of file
+DOMAIN = "cync_lights"
+
+SERVICE_BULK_SET = "bulk_set"
+SERVICE_START_CAPTURE = "start_capture"
+SERVICE_STOP_CAPTURE = "stop_capture"
+SERVICE_PROFILE = "profile"
+
+CONFIG_REFRESH_INTERVAL = timedelta(hours=1)
+
+STORAGE_VERSION = 1
+STORAGE_SAVE_DELAY = 10
\ No newline at end of file
@@ -1,11 +1,14 @@
 import logging
-import threading
 import asyncio
 import struct
 import aiohttp
 import math
+import random
 import ssl
-from typing import Any
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Iterator, NamedTuple
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -15,6 +18,10 @@ API_2FACTOR_AUTH = "https://api.gelighting.com/v2/user_auth/two_factor"
 API_DEVICES = "https://api.gelighting.com/v2/user/{user}/subscribe/devices"
 API_DEVICE_INFO = "https://api.gelighting.com/v2/product/{product_id}/device/{device_id}/property"
 
+CYNC_HOST = "cm.gelighting.com"
+CYNC_TLS_PORT = 23779
+CYNC_PORT = 23778
+
 Capabilities = {
     "ONOFF":[1,5,6,7,8,9,10,11,13,14,15,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,48,49,51,52,53,54,55,56,57,58,59,61,62,63,64,65,66,67,68,80,81,82,83,85,128,129,130,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,149,150,151,152,153,154,155,156,158,159,160,161,162,163,164,165,169,170],
     "BRIGHTNESS":[1,5,6,7,8,9,10,11,13,14,15,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,48,49,55,56,80,81,82,83,85,128,129,130,131,132,133,134,135,136,137,138,139,140,141,142,143,144,145,146,147,148,149,150,151,152,153,154,155,156,158,159,160,161,162,163,164,165,169,170],
@@ -28,263 +35,878 @@ Capabilities = {
     "MULTIELEMENT":{'67':2}
 }
 
+CAPABILITY_ONOFF = 1
+CAPABILITY_BRIGHTNESS = 2
+CAPABILITY_COLORTEMP = 4
+CAPABILITY_RGB = 8
+CAPABILITY_MOTION = 16
+CAPABILITY_AMBIENT_LIGHT = 32
+CAPABILITY_WIFICONTROL = 64
+CAPABILITY_PLUG = 128
+CAPABILITY_FAN = 256
+
+CAPABILITY_BITS = {"ONOFF":CAPABILITY_ONOFF, "BRIGHTNESS":CAPABILITY_BRIGHTNESS, "COLORTEMP":CAPABILITY_COLORTEMP, "RGB":CAPABILITY_RGB, "MOTION":CAPABILITY_MOTION, "AMBIENT_LIGHT":CAPABILITY_AMBIENT_LIGHT, "WIFICONTROL":CAPABILITY_WIFICONTROL, "PLUG":CAPABILITY_PLUG, "FAN":CAPABILITY_FAN}
+
+def build_capability_masks(capabilities):
+    """Map every device type to the bitmask of the CAPABILITY_BITS it supports"""
+    masks = {}
+    for capability, bit in CAPABILITY_BITS.items():
+        for device_type in capabilities[capability]:
+            masks[device_type] = masks.get(device_type, 0) | bit
+    return masks
+
+CAPABILITY_MASKS = build_capability_masks(Capabilities)
+
+FRAME_HEADER = struct.Struct(">BI")
+MAX_FRAME_LENGTH = 65536
+
+HEALTH_EWMA_ALPHA = 0.2
+HEALTH_LATENCY_BUCKET = 0.1
+DEMOTE_AFTER_FAILURES = 3
+DEMOTE_SUCCESS_RATE = 0.5
+PROBE_INTERVAL = 30
+
+RECONNECT_INITIAL_DELAY = 0.5
+RECONNECT_MAX_DELAY = 60
+RECONNECT_STABLE_TIME = 60
+RECONNECT_HISTORY = 20
+
+MAX_CONCURRENT_REQUESTS = 4
+
+#upper bounds in seconds of the command latency histogram buckets
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1, 1.5, 2.5, 5)
+ECHO_TIMEOUT = 10
+
+#entity state writes are collected for UPDATE_TICK seconds and written at most once per MIN_UPDATE_INTERVAL per entity
+UPDATE_TICK = 0.05
+MIN_UPDATE_INTERVAL = 0.25
+
+#color temperature range of the lights in mireds, commands carry it as a percentage of the range
+MIN_MIREDS = 200
+MAX_MIREDS = 500
+
+#results of CyncHub.bulk_set for each command
+COMMAND_ACKNOWLEDGED = "acknowledged"
+COMMAND_SUPERSEDED = "superseded"
+COMMAND_TIMEOUT = "timeout"
+COMMAND_FAILED = "failed"
+
+CAPTURE_INBOUND = 0
+CAPTURE_OUTBOUND = 1
+
+class CyncFrameReader:
+    """Reassemble complete frames from the Cync server TCP stream"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def feed(self, data):
+        """Append data read from the socket, dropping frames that have already been consumed"""
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer += data
+
+    def frames(self):
+        """Yield (packet_type, packet) for every complete frame in the buffer.
+
+        Packets are memoryviews into the receive buffer and are only valid until the next frame is requested.
+        """
+        buffer = self._buffer
+        end = len(buffer)
+        with memoryview(buffer) as view:
+            while end - self._offset >= FRAME_HEADER.size:
+                packet_type, packet_length = FRAME_HEADER.unpack_from(buffer, self._offset)
+                if packet_length > MAX_FRAME_LENGTH:
+                    _LOGGER.error("Invalid frame length " + str(packet_length) + ", discarding receive buffer")
+                    self._offset = end
+                    break
+                start = self._offset + FRAME_HEADER.size
+                if start + packet_length > end:
+                    break
+                self._offset = start + packet_length
+                packet = view[start:self._offset]
+                try:
+                    yield packet_type, packet
+                finally:
+                    packet.release()
+
+PACKET_HEADER = struct.Struct(">IH")
+SWITCH_ID = struct.Struct(">I")
+STATE_CHANGE = struct.Struct(">IH15xB5xBB")
+SENSOR_CHANGE = struct.Struct(">IH10xB5xBxB")
+PUSH_RESPONSE = struct.Struct(">BIIHB")
+# mesh index, state, brightness, color temp, r, g, b
+INITIAL_STATE_RECORD = struct.Struct(">B7xB3xB3xB3xBBBx")
+DEVICE_STATE_RECORD = struct.Struct(">3xBBBBBBB9x")
+
+class PushReceived(NamedTuple):
+    """Frame pushed by a controller that must be answered with a response packet"""
+    switch_id: str
+    response_id: int
+
+class StateChange(NamedTuple):
+    """Power and brightness change of a single mesh device"""
+    switch_id: str
+    mesh_index: int
+    state: bool
+    brightness: int
+
+class SensorChange(NamedTuple):
+    """Motion and ambient light change of a single mesh device"""
+    switch_id: str
+    mesh_index: int
+    motion: bool
+    ambient_light: bool
+
+class InitialState(NamedTuple):
+    """State of every mesh device reported by a controller in reply to a state request"""
+    switch_id: str
+    records: Iterator[tuple[int, int, int, int, int, int, int]]
+
+class DeviceStates(NamedTuple):
+    """State of several mesh devices reported by a controller"""
+    switch_id: str
+    records: Iterator[tuple[int, int, int, int, int, int, int]]
+
+class ControllerOnline(NamedTuple):
+    """A Wi-Fi connected controller answered a ping"""
+    switch_id: str
+
+class CommandAck(NamedTuple):
+    """The Cync server acknowledged a command"""
+    switch_id: str
+    seq: str
+
+class CyncColor(NamedTuple):
+    """Immutable RGB color of a switch or room, active when the device is in RGB mode"""
+    r: int = 0
+    g: int = 0
+    b: int = 0
+    active: bool = False
+
+NO_COLOR = CyncColor()
+
+# events are built directly with tuple.__new__, bypassing the slower generated NamedTuple.__new__
+_event = tuple.__new__
+
+def _decode_state_change(packet):
+    switch_id, response_id, mesh_index, state, brightness = STATE_CHANGE.unpack_from(packet)
+    return (_event(StateChange, (str(switch_id), mesh_index, state > 0, brightness if state else 0)),)
+
+def _decode_pushed_state_change(packet):
+    switch_id, response_id, mesh_index, state, brightness = STATE_CHANGE.unpack_from(packet)
+    switch_id = str(switch_id)
+    return (_event(PushReceived, (switch_id, response_id)), _event(StateChange, (switch_id, mesh_index, state > 0, brightness if state else 0)))
+
+def _decode_sensor_change(packet):
+    switch_id, response_id, mesh_index, motion, ambient_light = SENSOR_CHANGE.unpack_from(packet)
+    return (_event(SensorChange, (str(switch_id), mesh_index, motion > 0, ambient_light > 0)),)
+
+def _decode_pushed_sensor_change(packet):
+    switch_id, response_id, mesh_index, motion, ambient_light = SENSOR_CHANGE.unpack_from(packet)
+    switch_id = str(switch_id)
+    return (_event(PushReceived, (switch_id, response_id)), _event(SensorChange, (switch_id, mesh_index, motion > 0, ambient_light > 0)))
+
+def _decode_initial_state(packet):
+    switch_id, response_id = PACKET_HEADER.unpack_from(packet)
+    switch_id = str(switch_id)
+    #the last record is followed by a partial trailer and is not a device state
+    end = 22 + (len(packet) - 23)//INITIAL_STATE_RECORD.size*INITIAL_STATE_RECORD.size
+    records = INITIAL_STATE_RECORD.iter_unpack(packet[22:end])
+    return (_event(PushReceived, (switch_id, response_id)), _event(InitialState, (switch_id, records)))
+
+def _decode_push(packet):
+    switch_id, response_id = PACKET_HEADER.unpack_from(packet)
+    return (_event(PushReceived, (str(switch_id), response_id)),)
+
+def _decode_device_states(packet):
+    if packet[4] != 1 or packet[5] != 1 or packet[6] != 6:
+        return ()
+    end = 7 + (len(packet) - 7)//DEVICE_STATE_RECORD.size*DEVICE_STATE_RECORD.size
+    records = DEVICE_STATE_RECORD.iter_unpack(packet[7:end])
+    return (_event(DeviceStates, (str(PACKET_HEADER.unpack_from(packet)[0]), records)),)
+
+def _decode_controller_online(packet):
+    return (_event(ControllerOnline, (str(SWITCH_ID.unpack_from(packet)[0]),)),)
+
+def _decode_command_ack(packet):
+    switch_id, seq = PACKET_HEADER.unpack_from(packet)
+    return (_event(CommandAck, (str(switch_id), str(seq))),)
+
+# (packet type, subtype) -> (minimum packet length, decoder)
+# The subtype is byte 13 of the packet, (packet type, None) is used when no subtype specific decoder applies.
+FRAME_DECODERS = {
+    (115, 219): (33, _decode_pushed_state_change),
+    (115, 84): (25, _decode_pushed_sensor_change),
+    (115, 82): (52, _decode_initial_state),
+    (115, None): (6, _decode_push),
+    (131, 219): (33, _decode_state_change),
+    (131, 84): (25, _decode_sensor_change),
+    (67, None): (26, _decode_device_states),
+    (171, None): (4, _decode_controller_online),
+    (123, None): (6, _decode_command_ack),
+}
+
+def _decoder_key(packet_type, subtype):
+    return packet_type << 9 | (256 if subtype is None else subtype)
+
+_DECODER_TABLE = {_decoder_key(packet_type, subtype): entry for (packet_type, subtype), entry in FRAME_DECODERS.items()}
+
+def decode_frame(packet_type, packet):
+    """Decode a complete frame into a tuple of events"""
+    packet_length = len(packet)
+    entry = _DECODER_TABLE.get(packet_type << 9 | packet[13]) if packet_length > 13 else None
+    if entry is None or packet_length < entry[0]:
+        entry = _DECODER_TABLE.get(packet_type << 9 | 256)
+        if entry is None or packet_length < entry[0]:
+            return ()
+    return entry[1](packet)
+
+def build_mesh_indexes(home_devices, devices):
+    """Index the devices of all homes in a single pass.
+
+    home_devices maps each home to a list of device ids by mesh index, padded with empty strings. Returns
+    ({home_id: {mesh_index: device_id}}, {device_id: home_id}, {switch_id: [device_id, ...]}), the last one
+    only for Wi-Fi controllers of on/off devices.
+    """
+    mesh_devices = {}
+    device_homes = {}
+    for home_id, mesh in home_devices.items():
+        home_mesh = mesh_devices[home_id] = {}
+        for mesh_index, device_id in enumerate(mesh):
+            if device_id:
+                home_mesh[mesh_index] = device_id
+                device_homes[device_id] = home_id
+    switch_devices = {}
+    for device_id, device_info in devices.items():
+        switch_id = device_info.get('switch_id','0')
+        if device_info.get('ONOFF',False) and int(switch_id) > 0:
+            switch_devices.setdefault(switch_id, []).append(device_id)
+    return mesh_devices, device_homes, switch_devices
+
+class Reconnect(NamedTuple):
+    """A dropped or failed connection to the Cync server and the delay before the next attempt"""
+    time: float
+    connected_for: float
+    delay: float
+
+class ControllerHealth:
+    """Ack success rate and ack latency of the commands sent through one Wi-Fi connected controller"""
+
+    __slots__ = ('success_rate', 'latency', 'failures', 'demoted')
+
+    def __init__(self):
+        self.success_rate = 1.0
+        self.latency = 0.0
+        self.failures = 0
+        self.demoted = False
+
+    def record_ack(self, latency):
+        self.success_rate += HEALTH_EWMA_ALPHA*(1 - self.success_rate)
+        self.latency += HEALTH_EWMA_ALPHA*(latency - self.latency)
+        self.failures = 0
+        self.demoted = False
+
+    def record_timeout(self):
+        self.success_rate -= HEALTH_EWMA_ALPHA*self.success_rate
+        self.failures += 1
+        if self.failures >= DEMOTE_AFTER_FAILURES or self.success_rate < DEMOTE_SUCCESS_RATE:
+            self.demoted = True
+
+    def restore(self):
+        """Give a demoted controller that answered a probe another chance"""
+        self.failures = 0
+        self.success_rate = max(self.success_rate, DEMOTE_SUCCESS_RATE)
+        self.demoted = False
+
+    @property
+    def rank(self):
+        """Sort key, controllers whose expected latency falls in the same bucket keep their routing order"""
+        return (self.demoted, int(self.latency/max(self.success_rate, 0.01)/HEALTH_LATENCY_BUCKET))
+
+class LatencyHistogram:
+    """Latencies counted in LATENCY_BUCKETS, the last count is for latencies above the largest bucket"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0]*(len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency):
+        self.counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+
+    @property
+    def mean(self):
+        return self.total/self.count if self.count else None
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket that holds the given fraction of the latencies, capped at the largest latency"""
+        if self.count == 0:
+            return None
+        rank = fraction*self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(LATENCY_BUCKETS[index], self.max) if index < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+class CommandStats:
+    """Counters and latency histograms of the commands sent through one controller or to the devices of one home.
+
+    Every attempt counts as sent, attempts after the first one of a command also count as retries and a command that
+    was never acknowledged counts as failed. Echo latency is the time from sending a command until the state of a
+    targeted switch is reported by the Cync server.
+    """
+
+    __slots__ = ('sent', 'acked', 'retries', 'timeouts', 'failed', 'ack_latency', 'echo_latency')
+
+    def __init__(self):
+        self.sent = 0
+        self.acked = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.ack_latency = LatencyHistogram()
+        self.echo_latency = LatencyHistogram()
+
+    def record_sent(self, retry):
+        self.sent += 1
+        if retry:
+            self.retries += 1
+
+    def record_ack(self, latency):
+        self.acked += 1
+        self.ack_latency.record(latency)
+
+class UpdateDispatcher:
+    """Coalesce the entity state writes of switches, rooms and sensors.
+
+    Published devices are written on the next tick, so changes that land within a tick are written once. A device
+    written less than min_interval ago stays queued until the interval has passed, the flush is scheduled for the
+    earliest due device. Entities read the state of their device when they are written, so the last value always wins
+    and the final state is never dropped.
+    """
+
+    def __init__(self, tick = UPDATE_TICK, min_interval = MIN_UPDATE_INTERVAL):
+        self.tick = tick
+        self.min_interval = min_interval
+        self.loop = None
+        self._dirty = {}
+        self._last_written = {}
+        self._handle = None
+
+    def publish(self, device):
+        """Queue the state write of a device, written at once when no event loop is running the hub"""
+        if self.loop is None:
+            device._update_callback()
+            return
+        self._dirty[device] = None
+        when = max(self.loop.time() + self.tick, self._last_written.get(device, -self.min_interval) + self.min_interval)
+        if self._handle is None or when < self._handle.when():
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = self.loop.call_at(when, self._flush)
+
+    def retain(self, devices):
+        """Forget every device not in devices, called when a config refresh removed or replaced devices"""
+        self._dirty = {device: None for device in self._dirty if device in devices}
+        self._last_written = {device: written for device, written in self._last_written.items() if device in devices}
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._dirty.clear()
+
+    def _flush(self):
+        self._handle = None
+        now = self.loop.time()
+        last_written = self._last_written
+        dirty = self._dirty
+        self._dirty = {}
+        due = None
+        for device in dirty:
+            device_due = last_written.get(device, -self.min_interval) + self.min_interval
+            if device_due > now:
+                self._dirty[device] = None
+                due = device_due if due is None else min(due, device_due)
+            elif device._update_callback:
+                last_written[device] = now
+                device._update_callback()
+        if due is not None:
+            self._handle = self.loop.call_at(due, self._flush)
+
 class CyncHub:
 
-    def __init__(self, user_data, options, remove_options_update_listener):
+    def __init__(self, user_data, options, remove_options_update_listener, snapshot = None, state_changed = None, host = CYNC_HOST, port = CYNC_PORT, tls_port = CYNC_TLS_PORT, tls = True, min_update_interval = MIN_UPDATE_INTERVAL):
 
-        self.thread = None
+        self.user_data = user_data
+        self.host = host
+        self.port = port
+        self.tls_port = tls_port
+        self.tls = tls
         self.loop = None
+        self._tcp_client = None
         self.reader = None
         self.writer = None
+        self._frame_reader = None
+        self._write_queue = None
+        self.command_ttl = 0.5
         self.login_code = bytearray(user_data['cync_credentials'])
         self.logged_in = False
-        self.home_devices = user_data['cync_config']['home_devices']
+        self._logged_in_event = None
+        self._reconnect_attempts = 0
+        self.reconnect_history = deque(maxlen = RECONNECT_HISTORY)
+        self.dispatcher = UpdateDispatcher(min_interval = min_update_interval)
+        self.home_devices, self.device_homes, self.switchID_to_deviceIDs = build_mesh_indexes(user_data['cync_config']['home_devices'], user_data['cync_config']['devices'])
         self.home_controllers = user_data['cync_config']['home_controllers']
         self.switchID_to_homeID = user_data['cync_config']['switchID_to_homeID']
-        self.connected_devices = {home_id:[] for home_id in self.home_controllers.keys()}
+        self.connected_devices = {home_id:set() for home_id in self.home_controllers.keys()}
+        self.connected_controllers = {home_id:[] for home_id in self.home_controllers.keys()}
         self.shutting_down = False
         self.remove_options_update_listener = remove_options_update_listener
         self.cync_rooms = {room_id:CyncRoom(room_id,room_info,self) for room_id,room_info in user_data['cync_config']['rooms'].items()}
         self.cync_switches = {device_id:CyncSwitch(device_id,switch_info,self.cync_rooms.get(switch_info['room'], None),self) for device_id,switch_info in user_data['cync_config']['devices'].items() if switch_info.get("ONOFF",False)}
-        self.cync_motion_sensors = {device_id:CyncMotionSensor(device_id,device_info,self.cync_rooms.get(device_info['room'], None)) for device_id,device_info in user_data['cync_config']['devices'].items() if device_info.get("MOTION",False)}
-        self.cync_ambient_light_sensors = {device_id:CyncAmbientLightSensor(device_id,device_info,self.cync_rooms.get(device_info['room'], None)) for device_id,device_info in user_data['cync_config']['devices'].items() if device_info.get("AMBIENT_LIGHT",False)}
-        self.switchID_to_deviceIDs = {device_info.switch_id:[dev_id for dev_id, dev_info in self.cync_switches.items() if dev_info.switch_id == device_info.switch_id] for device_id, device_info in self.cync_switches.items() if int(device_info.switch_id) > 0}
+        self.cync_motion_sensors = {device_id:CyncMotionSensor(device_id,device_info,self.cync_rooms.get(device_info['room'], None),self) for device_id,device_info in user_data['cync_config']['devices'].items() if device_info.get("MOTION",False)}
+        self.cync_ambient_light_sensors = {device_id:CyncAmbientLightSensor(device_id,device_info,self.cync_rooms.get(device_info['room'], None),self) for device_id,device_info in user_data['cync_config']['devices'].items() if device_info.get("AMBIENT_LIGHT",False)}
+        self._index_devices()
         self.connected_devices_updated = False
         self.options = options
         self._seq_num = 0
         self.pending_commands = {}
+        self.pending_command_sent = {}
+        self.last_received = None
+        self.last_sent = None
+        #packet type -> time the last frame of that type was received
+        self.last_frames = {}
+        self.controller_health = {}
+        self.controller_command_stats = {}
+        self.home_command_stats = {}
+        #switch -> [send time, controller stats, home stats] of the last command that targeted it, until its state is reported
+        self._awaiting_echo = {}
+        self._dirty_switches = {}
+        self._dirty_rooms = {}
+        self.entity_adders = []
+        #set to a capture.FrameCapture to record the traffic with the Cync server
+        self.capture = None
+        self._event_handlers = {
+            PushReceived: self._on_push_received,
+            StateChange: self._on_state_change,
+            SensorChange: self._on_sensor_change,
+            InitialState: self._on_initial_state,
+            DeviceStates: self._on_device_states,
+            ControllerOnline: self._on_controller_online,
+            CommandAck: self._on_command_ack,
+        }
         [room.initialize() for room in self.cync_rooms.values() if room.is_subgroup]
         [room.initialize() for room in self.cync_rooms.values() if not room.is_subgroup]
-        
-    def start_tcp_client(self):
-        self.thread = threading.Thread(target=self._start_tcp_client,daemon=True)
-        self.thread.start()
+        self.state_changed = None
+        if snapshot:
+            self.restore_snapshot(snapshot)
+        self.state_changed = state_changed
+
+    def snapshot(self):
+        """Compact last known state of every switch, rooms are derived from their switches on restore"""
+        return {'switches': {device_id:[switch.power_state, switch.brightness, switch.color_temp, *switch.rgb] for device_id, switch in self.cync_switches.items() if switch.update_received or switch.restored}}
+
+    def restore_snapshot(self, snapshot):
+        """Restore the switch states of a snapshot, live state from the Cync server replaces them once it arrives"""
+        try:
+            for device_id, (state, brightness, color_temp, r, g, b, active) in snapshot.get('switches', {}).items():
+                switch = self.cync_switches.get(device_id)
+                if switch is not None:
+                    switch.update_switch(state, brightness, color_temp, CyncColor(r, g, b, active))
+                    #restored state was not received from the Cync server
+                    switch.update_received = False
+                    switch.restored = True
+        except Exception as e:
+            _LOGGER.error(str(type(e).__name__) + ": " + str(e))
+        self.flush_updates()
+
+    def _index_devices(self):
+        """Index multi-element switches and the switches and rooms of every home"""
+        self.switch_elements = {device_id:self._find_switch_elements(switch) for device_id, switch in self.cync_switches.items() if switch.elements > 1}
+        self.home_switches = {home_id:[] for home_id in self.home_controllers.keys()}
+        for switch in self.cync_switches.values():
+            self.home_switches.setdefault(switch.home_id, []).append(switch)
+        self.home_rooms = {home_id:[] for home_id in self.home_controllers.keys()}
+        for room in self.cync_rooms.values():
+            self.home_rooms.setdefault(room.home_id, []).append(room)
+
+    def update_config(self, user_data, options):
+        """Apply a refreshed Cync config while the connection stays up.
+
+        Switches, rooms and sensors that still exist are updated in place, new ones are created and get their entities
+        from the entity_adders. Returns the unique ids of the entities whose switch, room or sensor was removed, or
+        replaced because the members of the room changed.
+        """
+        cync_config = user_data['cync_config']
+        removed = []
+        self.user_data = user_data
+        self.options = options
+        self.login_code = bytearray(user_data['cync_credentials'])
+        self.home_devices, self.device_homes, self.switchID_to_deviceIDs = build_mesh_indexes(cync_config['home_devices'], cync_config['devices'])
+        self.home_controllers = cync_config['home_controllers']
+        self.switchID_to_homeID = cync_config['switchID_to_homeID']
+        for home_id in [home_id for home_id in self.connected_devices if home_id not in self.home_controllers]:
+            self.connected_devices.pop(home_id)
+            self.connected_controllers.pop(home_id)
+        for home_id in self.home_controllers.keys():
+            self.connected_devices.setdefault(home_id, set()).intersection_update(self.device_homes)
+            self.connected_controllers[home_id] = [controller for controller in self.connected_controllers.get(home_id, []) if controller in self.switchID_to_deviceIDs]
 
-    def _start_tcp_client(self):
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
-        self.loop.run_until_complete(self._connect())
+        rooms = {}
+        for room_id, room_info in cync_config['rooms'].items():
+            room = self.cync_rooms.get(room_id)
+            if room is not None and room.switches == room_info.get('switches',[]) and room.subgroups == room_info.get('subgroups',[]):
+                room.update_info(room_info)
+            else:
+                if room is not None:
+                    removed.append(room.unique_id)
+                room = CyncRoom(room_id, room_info, self)
+            rooms[room_id] = room
+        removed.extend([room.unique_id for room_id, room in self.cync_rooms.items() if room_id not in rooms])
+
+        switches = {}
+        for device_id, switch_info in cync_config['devices'].items():
+            if switch_info.get("ONOFF",False):
+                switch = self.cync_switches.get(device_id)
+                if switch is None:
+                    switch = CyncSwitch(device_id, switch_info, rooms.get(switch_info['room'], None), self)
+                else:
+                    switch.update_info(switch_info, rooms.get(switch_info['room'], None))
+                switches[device_id] = switch
+        removed.extend(['cync_switch_' + device_id for device_id in self.cync_switches if device_id not in switches])
+
+        motion_sensors = {}
+        ambient_light_sensors = {}
+        for device_id, device_info in cync_config['devices'].items():
+            room = rooms.get(device_info['room'], None)
+            if device_info.get("MOTION",False):
+                motion_sensors[device_id] = self.cync_motion_sensors.get(device_id) or CyncMotionSensor(device_id, device_info, room, self)
+                motion_sensors[device_id].update_info(device_info, room)
+            if device_info.get("AMBIENT_LIGHT",False):
+                ambient_light_sensors[device_id] = self.cync_ambient_light_sensors.get(device_id) or CyncAmbientLightSensor(device_id, device_info, room, self)
+                ambient_light_sensors[device_id].update_info(device_info, room)
+        removed.extend(['cync_motion_sensor_' + device_id for device_id in self.cync_motion_sensors if device_id not in motion_sensors])
+        removed.extend(['cync_ambient_light_sensor_' + device_id for device_id in self.cync_ambient_light_sensors if device_id not in ambient_light_sensors])
+
+        self.cync_rooms = rooms
+        self.cync_switches = switches
+        self.cync_motion_sensors = motion_sensors
+        self.cync_ambient_light_sensors = ambient_light_sensors
+        self._index_devices()
+        for member in list(switches.values()) + list(rooms.values()):
+            member._update_parent_room = None
+        for room in rooms.values():
+            room.all_room_switches = room.switches
+        [room.initialize() for room in rooms.values() if room.is_subgroup]
+        [room.initialize() for room in rooms.values() if not room.is_subgroup]
+        if self.connected_devices_updated:
+            for home_id in self.home_controllers.keys():
+                self._update_home_controllers(home_id)
+        devices = [*switches.values(), *rooms.values(), *motion_sensors.values(), *ambient_light_sensors.values()]
+        self.dispatcher.retain(set(devices))
+        self.flush_updates()
+        #renamed switches, rooms and sensors publish their new names
+        for device in devices:
+            device.publish_update()
+        return removed
+
+    def _find_switch_elements(self, switch):
+        """Return the switches controlled by each element of a multi-element device, None for elements that are not switches"""
+        home_devices = self.home_devices[switch.home_id]
+        mesh_index = int.from_bytes(switch.mesh_id,'little')
+        return [self.cync_switches.get(home_devices.get((i+1)*256 + mesh_index)) for i in range(switch.elements)]
+
+    def start_tcp_client(self, create_task = None):
+        """Start the Cync client as a background task on the running event loop.
+
+        create_task(coro) lets the caller own the task, Home Assistant passes one that cancels it at stop and unload.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.dispatcher.loop = self.loop
+        if create_task is None:
+            self._tcp_client = self.loop.create_task(self._connect(), name = "Cync TCP Client")
+        else:
+            self._tcp_client = create_task(self._connect())
 
     def disconnect(self):
         self.shutting_down = True
-        for home_controllers in self.home_controllers.values(): #send packets to server to generate data to be read which will initiate shutdown
-            for controller in home_controllers:
-                seq = self.get_seq_num()
-                state_request = bytes.fromhex('7300000018') + int(controller).to_bytes(4,'big') + seq.to_bytes(2,'big') + bytes.fromhex('007e00000000f85206000000ffff0000567e')
-                self.loop.call_soon_threadsafe(self.send_request,state_request)
+        self.dispatcher.cancel()
+        if self._tcp_client is not None:
+            self._tcp_client.cancel()
 
     async def _connect(self):
         while not self.shutting_down:
             try:
-                context = ssl.create_default_context()
-                try:
-                    self.reader, self.writer = await asyncio.open_connection('cm.gelighting.com', 23779, ssl = context)
-                except Exception as e:
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
+                if self.tls:
+                    context = await self.loop.run_in_executor(None, ssl.create_default_context)
                     try:
-                        self.reader, self.writer = await asyncio.open_connection('cm.gelighting.com', 23779, ssl = context)
+                        self.reader, self.writer = await asyncio.open_connection(self.host, self.tls_port, ssl = context)
                     except Exception as e:
-                        self.reader, self.writer = await asyncio.open_connection('cm.gelighting.com', 23778)
+                        context.check_hostname = False
+                        context.verify_mode = ssl.CERT_NONE
+                        try:
+                            self.reader, self.writer = await asyncio.open_connection(self.host, self.tls_port, ssl = context)
+                        except Exception as e:
+                            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                else:
+                    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
             except Exception as e:
                 _LOGGER.error(str(type(e).__name__) + ": " + str(e))
-                await asyncio.sleep(5)
+                await self._wait_before_reconnect(0)
             else:
+                connected_at = self.loop.time()
+                #after a reset the devices found connected before the drop are reused and only their state is requested again
+                resync = self.connected_devices_updated
+                self._write_queue = asyncio.Queue()
+                self._logged_in_event = asyncio.Event()
                 read_tcp_messages = asyncio.create_task(self._read_tcp_messages(), name = "Read TCP Messages")
+                write_tcp_messages = asyncio.create_task(self._write_tcp_messages(), name = "Write TCP Messages")
                 maintain_connection = asyncio.create_task(self._maintain_connection(), name = "Maintain Connection")
-                update_state = asyncio.create_task(self._update_state(), name = "Update State")
-                update_connected_devices = asyncio.create_task(self._update_connected_devices(), name = "Update Connected Devices")
-                read_write_tasks = [read_tcp_messages, maintain_connection, update_state, update_connected_devices]
+                update_state = asyncio.create_task(self._update_state(resync), name = "Update State")
+                update_connected_devices = asyncio.create_task(self._update_connected_devices(resync), name = "Update Connected Devices")
+                probe_controllers = asyncio.create_task(self._probe_controllers(), name = "Probe Controllers")
+                read_write_tasks = [read_tcp_messages, write_tcp_messages, maintain_connection, update_state, update_connected_devices, probe_controllers]
                 try:
                     done, pending = await asyncio.wait(read_write_tasks,return_when=asyncio.FIRST_EXCEPTION)
                     for task in done:
-                        name = task.get_name()
-                        exception = task.exception()
                         try:
                             result = task.result()
                         except Exception as e:
                             _LOGGER.error(str(type(e).__name__) + ": " + str(e))
-                    for task in pending:
-                        task.cancel()                    
-                    if not self.shutting_down:
-                        _LOGGER.error("Connection to Cync server reset, restarting in 15 seconds")
-                        await asyncio.sleep(15)
-                    else:
-                        _LOGGER.debug("Cync client shutting down")
                 except Exception as e:
                     _LOGGER.error(str(type(e).__name__) + ": " + str(e))
+                finally:
+                    #also reached when the client task is cancelled by disconnect()
+                    for task in read_write_tasks:
+                        task.cancel()
+                    self.logged_in = False
+                    self.writer.close()
+                if not self.shutting_down:
+                    connected_for = self.loop.time() - connected_at
+                    if connected_for >= RECONNECT_STABLE_TIME:
+                        self._reconnect_attempts = 0
+                    await self._wait_before_reconnect(connected_for)
+                else:
+                    _LOGGER.debug("Cync client shutting down")
+
+    def _reconnect_delay(self):
+        """Jittered exponential backoff, the first retry after a stable connection drops is almost immediate"""
+        delay = min(RECONNECT_MAX_DELAY, RECONNECT_INITIAL_DELAY * 2**self._reconnect_attempts)
+        self._reconnect_attempts += 1
+        return random.uniform(delay/2, delay)
+
+    async def _wait_before_reconnect(self, connected_for):
+        delay = self._reconnect_delay()
+        self.reconnect_history.append(Reconnect(time.time(), connected_for, delay))
+        _LOGGER.error("Connection to Cync server reset, restarting in %.1f seconds", delay)
+        await asyncio.sleep(delay)
 
     async def _read_tcp_messages(self):
-        self.writer.write(self.login_code)
+        self._write(self.login_code)
         await self.writer.drain()
-        await self.reader.read(1000)
+        self._frame_reader = CyncFrameReader()
+        self._process_data(await self.reader.read(1000))
         self.logged_in = True
+        self._logged_in_event.set()
         while not self.shutting_down:
-            data = await self.reader.read(1000)
+            data = await self.reader.read(65536)
             if len(data) == 0:
                 self.logged_in = False
                 raise LostConnection
-            while len(data) >= 12:
-                packet_type = int(data[0])
-                packet_length = struct.unpack(">I", data[1:5])[0]
-                packet = data[5:packet_length+5]
-                try:
-                    if packet_length == len(packet):
-                        if packet_type == 115:
-                            switch_id = str(struct.unpack(">I", packet[0:4])[0])
-                            home_id = self.switchID_to_homeID[switch_id]
-
-                            #send response packet
-                            response_id = struct.unpack(">H", packet[4:6])[0]
-                            response_packet = bytes.fromhex('7300000007') + int(switch_id).to_bytes(4,'big') + response_id.to_bytes(2,'big') + bytes.fromhex('00')
-                            self.loop.call_soon_threadsafe(self.send_request, response_packet)
-
-                            if packet_length >= 33 and int(packet[13]) == 219:
-                                #parse state and brightness change packet
-                                deviceID = self.home_devices[home_id][int(packet[21])]
-                                state = int(packet[27]) > 0
-                                brightness = int(packet[28]) if state else 0
-                                if deviceID in self.cync_switches:
-                                    self.cync_switches[deviceID].update_switch(state,brightness,self.cync_switches[deviceID].color_temp,self.cync_switches[deviceID].rgb)
-                            elif packet_length >= 25 and int(packet[13]) == 84:
-                                #parse motion and ambient light sensor packet
-                                deviceID = self.home_devices[home_id][int(packet[16])]
-                                motion = int(packet[22]) > 0
-                                ambient_light = int(packet[24]) > 0
-                                if deviceID in self.cync_motion_sensors:
-                                    self.cync_motion_sensors[deviceID].update_motion_sensor(motion)
-                                if deviceID in self.cync_ambient_light_sensors:
-                                    self.cync_ambient_light_sensors[deviceID].update_ambient_light_sensor(ambient_light)
-                            elif packet_length > 51 and int(packet[13]) == 82:
-                                #parse initial state packet
-                                switch_id = str(struct.unpack(">I", packet[0:4])[0])
-                                home_id = self.switchID_to_homeID[switch_id]
-                                self._add_connected_devices(switch_id, home_id)
-                                packet = packet[22:]
-                                while len(packet) > 24:
-                                    deviceID = self.home_devices[home_id][int(packet[0])]
-                                    if deviceID in self.cync_switches:
-                                        if self.cync_switches[deviceID].elements > 1:
-                                            for i in range(self.cync_switches[deviceID].elements):
-                                                device_id = self.home_devices[home_id][(i+1)*256 + int(packet[0])]
-                                                state = int((int(packet[12]) >> i) & int(packet[8])) > 0
-                                                brightness = 100 if state else 0
-                                                self.cync_switches[device_id].update_switch(state, brightness, self.cync_switches[device_id].color_temp, self.cync_switches[device_id].rgb)
-                                        else:
-                                            state = int(packet[8]) > 0
-                                            brightness = int(packet[12]) if state else 0
-                                            color_temp = int(packet[16])
-                                            rgb = {'r':int(packet[20]),'g':int(packet[21]),'b':int(packet[22]),'active':int(packet[16])==254}
-                                            self.cync_switches[deviceID].update_switch(state,brightness,color_temp,rgb)
-                                    packet = packet[24:]
-                        elif packet_type == 131:
-                            switch_id = str(struct.unpack(">I", packet[0:4])[0])
-                            home_id = self.switchID_to_homeID[switch_id]
-                            if packet_length >= 33 and int(packet[13]) == 219:
-                                #parse state and brightness change packet
-                                deviceID = self.home_devices[home_id][int(packet[21])]
-                                state = int(packet[27]) > 0
-                                brightness = int(packet[28]) if state else 0
-                                if deviceID in self.cync_switches:
-                                    self.cync_switches[deviceID].update_switch(state,brightness,self.cync_switches[deviceID].color_temp,self.cync_switches[deviceID].rgb)
-                            elif packet_length >= 25 and int(packet[13]) == 84:
-                                #parse motion and ambient light sensor packet
-                                deviceID = self.home_devices[home_id][int(packet[16])]
-                                motion = int(packet[22]) > 0
-                                ambient_light = int(packet[24]) > 0
-                                if deviceID in self.cync_motion_sensors:
-                                    self.cync_motion_sensors[deviceID].update_motion_sensor(motion)
-                                if deviceID in self.cync_ambient_light_sensors:
-                                    self.cync_ambient_light_sensors[deviceID].update_ambient_light_sensor(ambient_light)
-                        elif packet_type == 67 and packet_length >= 26 and int(packet[4]) == 1 and int(packet[5]) == 1 and int(packet[6]) == 6:
-                            #parse state packet
-                            switch_id = str(struct.unpack(">I", packet[0:4])[0])
-                            home_id = self.switchID_to_homeID[switch_id]
-                            packet = packet[7:]
-                            while len(packet) >= 19:
-                                if int(packet[3]) < len(self.home_devices[home_id]):
-                                    deviceID = self.home_devices[home_id][int(packet[3])]
-                                    if deviceID in self.cync_switches:
-                                        if self.cync_switches[deviceID].elements > 1:
-                                            for i in range(self.cync_switches[deviceID].elements):
-                                                device_id = self.home_devices[home_id][(i+1)*256 + int(packet[3])]
-                                                state = int((int(packet[5]) >> i) & int(packet[4])) > 0
-                                                brightness = 100 if state else 0
-                                                self.cync_switches[device_id].update_switch(state, brightness, self.cync_switches[device_id].color_temp, self.cync_switches[device_id].rgb)
-                                        else:
-                                            state = int(packet[4]) > 0
-                                            brightness = int(packet[5]) if state else 0
-                                            color_temp = int(packet[6])
-                                            rgb = {'r':int(packet[7]),'g':int(packet[8]),'b':int(packet[9]),'active':int(packet[6])==254}
-                                            self.cync_switches[deviceID].update_switch(state,brightness,color_temp,rgb)
-                                packet = packet[19:]
-                        elif packet_type == 171:
-                            switch_id = str(struct.unpack(">I", packet[0:4])[0])
-                            home_id = self.switchID_to_homeID[switch_id]
-                            self._add_connected_devices(switch_id, home_id)
-                        elif packet_type == 123:
-                            seq = str(struct.unpack(">H", packet[4:6])[0])
-                            command_received = self.pending_commands.get(seq,None)
-                            if command_received is not None:
-                                command_received(seq)
-                except Exception as e:
-                    _LOGGER.error(str(type(e).__name__) + ": " + str(e))
-                data = data[packet_length+5:]
+            self._process_data(data)
         raise ShuttingDown
 
+    def _process_data(self, data):
+        """Feed data read from the Cync server to the frame reader and handle every complete frame"""
+        if self.capture is not None:
+            self.capture.record(CAPTURE_INBOUND, data)
+        self.last_received = now = time.time()
+        last_frames = self.last_frames
+        self._frame_reader.feed(data)
+        for packet_type, packet in self._frame_reader.frames():
+            last_frames[packet_type] = now
+            self._handle_frame(packet_type, packet)
+        self.flush_updates()
+
+    def _handle_frame(self, packet_type, packet):
+        """Decode a single complete frame received from the Cync server and apply its events"""
+        try:
+            for event in decode_frame(packet_type, packet):
+                self._event_handlers[type(event)](event)
+        except Exception as e:
+            _LOGGER.error(str(type(e).__name__) + ": " + str(e))
+
+    def _on_push_received(self, event):
+        #responses bypass the write queue, the writer task drains the transport buffer
+        self._write(PUSH_RESPONSE.pack(115, 7, int(event.switch_id), event.response_id, 0))
+
+    def _on_state_change(self, event):
+        home_id = self.switchID_to_homeID[event.switch_id]
+        deviceID = self.home_devices[home_id].get(event.mesh_index)
+        if deviceID in self.cync_switches:
+            if self._awaiting_echo and self.cync_switches[deviceID] in self._awaiting_echo:
+                self._record_echo(self.cync_switches[deviceID])
+            self.cync_switches[deviceID].update_switch(event.state,event.brightness,self.cync_switches[deviceID].color_temp,self.cync_switches[deviceID].rgb)
+
+    def _on_sensor_change(self, event):
+        home_id = self.switchID_to_homeID[event.switch_id]
+        deviceID = self.home_devices[home_id].get(event.mesh_index)
+        if deviceID in self.cync_motion_sensors:
+            self.cync_motion_sensors[deviceID].update_motion_sensor(event.motion)
+        if deviceID in self.cync_ambient_light_sensors:
+            self.cync_ambient_light_sensors[deviceID].update_ambient_light_sensor(event.ambient_light)
+
+    def _on_initial_state(self, event):
+        home_id = self.switchID_to_homeID[event.switch_id]
+        self._add_connected_devices(event.switch_id, home_id)
+        self._update_switches(home_id, event.records)
+
+    def _on_device_states(self, event):
+        self._update_switches(self.switchID_to_homeID[event.switch_id], event.records)
+
+    def _update_switches(self, home_id, records):
+        """Update switches from the (mesh index, state, brightness, color temp, r, g, b) records of a state packet"""
+        home_devices = self.home_devices[home_id]
+        awaiting_echo = self._awaiting_echo
+        for mesh_index, state, brightness, color_temp, r, g, b in records:
+            switch = self.cync_switches.get(home_devices.get(mesh_index))
+            if switch is None:
+                continue
+            if awaiting_echo and switch in awaiting_echo:
+                self._record_echo(switch)
+            if switch.elements > 1:
+                for i, element in enumerate(self.switch_elements[switch.device_id]):
+                    if element is None:
+                        continue
+                    element_state = (brightness >> i) & state > 0
+                    element.update_switch(element_state, 100 if element_state else 0, element.color_temp, element.rgb)
+            else:
+                switch.update_switch(state > 0, brightness if state else 0, color_temp, _event(CyncColor, (r, g, b, color_temp == 254)))
+
+    def _on_controller_online(self, event):
+        home_id = self.switchID_to_homeID[event.switch_id]
+        self._add_connected_devices(event.switch_id, home_id)
+        health = self.controller_health.get(event.switch_id)
+        if health is not None and health.demoted:
+            health.restore()
+
+    def _on_command_ack(self, event):
+        command_received = self.pending_commands.pop(event.seq,None)
+        if command_received is not None and not command_received.done():
+            command_received.set_result(True)
+
+    def queue_switch_update(self, switch, previous_state):
+        """Mark a switch as changed, previous_state is its state at the last flush"""
+        self._dirty_switches.setdefault(switch, previous_state)
+
+    def queue_room_update(self, room):
+        """Mark a room as having members that changed since the last flush"""
+        self._dirty_rooms[room] = None
+
+    def flush_updates(self):
+        """Publish every switch and room changed since the last flush exactly once"""
+        dirty_switches = self._dirty_switches
+        self._dirty_switches = {}
+        changed = False
+        for switch, previous_state in dirty_switches.items():
+            if previous_state != (switch.power_state, switch.brightness, switch.color_temp, switch.rgb):
+                changed = True
+                switch.publish_update()
+                if switch._update_parent_room:
+                    switch._update_parent_room(switch, previous_state)
+        #subgroups first, so rooms see the changes of their subgroups before they are published
+        dirty_rooms = self._dirty_rooms
+        for room in [room for room in dirty_rooms if room.is_subgroup]:
+            room._publish_room_state()
+        for room in [room for room in dirty_rooms if not room.is_subgroup]:
+            room._publish_room_state()
+        dirty_rooms.clear()
+        if changed and self.state_changed:
+            self.state_changed()
 
     async def _maintain_connection(self):
         while not self.shutting_down:
             await asyncio.sleep(180)
-            self.writer.write(bytes.fromhex('d300000000'))
-            await self.writer.drain()
+            self.send_request(bytes.fromhex('d300000000'))
         raise ShuttingDown
 
     def _add_connected_devices(self,switch_id, home_id):
-        for dev in self.switchID_to_deviceIDs[switch_id]:
-            #update list of WiFi connected devices
-            if dev not in self.connected_devices[home_id]:
-                self.connected_devices[home_id].append(dev)
-                if self.connected_devices_updated:
-                    for dev in self.cync_switches.values():
-                        dev.update_controllers()
-                    for room in self.cync_rooms.values():
-                        room.update_controllers() 
-
-    async def _update_connected_devices(self):
+        connected_devices = self.connected_devices[home_id]
+        new_devices = [dev for dev in self.switchID_to_deviceIDs[switch_id] if dev not in connected_devices]
+        if len(new_devices) > 0:
+            #update set of WiFi connected devices
+            connected_devices.update(new_devices)
+            self.connected_controllers[home_id].extend([self.cync_switches[dev].switch_id for dev in new_devices])
+            if self.connected_devices_updated:
+                self._update_home_controllers(home_id)
+
+    def _update_home_controllers(self, home_id):
+        """Recompute the controllers of the switches and rooms of a home after its connected devices changed"""
+        for switch in self.home_switches.get(home_id, []):
+            switch.update_controllers()
+        for room in self.home_rooms.get(home_id, []):
+            room.update_controllers()
+
+    async def _update_connected_devices(self, resync):
+        """Discover the Wi-Fi connected devices of every home, after a reconnect only homes with too few known devices are searched"""
         while not self.shutting_down:
-            self.connected_devices_updated = False
-            for devices in self.connected_devices.values():
-                devices.clear()
-            while not self.logged_in:
-                await asyncio.sleep(2)
+            if not resync:
+                self.connected_devices_updated = False
+                for devices in self.connected_devices.values():
+                    devices.clear()
+                for controllers in self.connected_controllers.values():
+                    controllers.clear()
+            await self._logged_in_event.wait()
             attempts = 0
-            while True in [len(devices) < len(self.home_controllers[home_id]) * 0.5 for home_id,devices in self.connected_devices.items()] and attempts < 10:
-                for home_id, home_controllers in self.home_controllers.items():
-                    for controller in home_controllers:
-                        seq = self.get_seq_num()
-                        ping = bytes.fromhex('a300000007') + int(controller).to_bytes(4,'big') + seq.to_bytes(2,'big') + bytes.fromhex('00')
-                        self.loop.call_soon_threadsafe(self.send_request, ping)
+            while len(homes := [home_id for home_id,devices in self.connected_devices.items() if len(devices) < len(self.home_controllers[home_id]) * 0.5]) > 0 and attempts < 10:
+                for home_id in homes:
+                    for controller in self.home_controllers[home_id]:
+                        self.ping_controller(controller)
                         await asyncio.sleep(0.15)
                 await asyncio.sleep(2)
-                attempts += 1            
-            for dev in self.cync_switches.values():
-                dev.update_controllers()
-            for room in self.cync_rooms.values():
-                room.update_controllers()
+                attempts += 1
+            for home_id in self.home_controllers.keys():
+                self._update_home_controllers(home_id)
             self.connected_devices_updated = True
+            resync = False
             await asyncio.sleep(3600)
         raise ShuttingDown
 
-    async def _update_state(self):
+    async def _probe_controllers(self):
+        """Ping demoted controllers, a controller that answers is restored by _on_controller_online"""
+        while not self.shutting_down:
+            await asyncio.sleep(PROBE_INTERVAL)
+            for controller, health in list(self.controller_health.items()):
+                if health.demoted:
+                    self.ping_controller(controller)
+        raise ShuttingDown
+
+    async def _update_state(self, resync):
+        """Request the state of every home, after a reconnect only switches and rooms whose state drifted are published"""
+        await self._logged_in_event.wait()
         while not self.connected_devices_updated:
             await asyncio.sleep(2)
-        for connected_devices in self.connected_devices.values():
-            if len(connected_devices) > 0:
-                controller = self.cync_switches[connected_devices[0]].switch_id
+        for connected_controllers in self.connected_controllers.values():
+            if len(connected_controllers) > 0:
+                controller = self.rank_controllers(connected_controllers)[0]
                 seq = self.get_seq_num()
                 state_request = bytes.fromhex('7300000018') + int(controller).to_bytes(4,'big') + seq.to_bytes(2,'big') + bytes.fromhex('007e00000000f85206000000ffff0000567e')
-                self.loop.call_soon_threadsafe(self.send_request,state_request)
+                self.send_request(state_request)
+        if resync:
+            return
         while False in [self.cync_switches[dev_id]._update_callback is not None for dev_id in self.options["switches"]] and False in [self.cync_rooms[dev_id]._update_callback is not None for dev_id in self.options["rooms"]]:
             await asyncio.sleep(2)
         for dev in self.cync_switches.values():
@@ -292,27 +914,177 @@ class CyncHub:
         for room in self.cync_rooms.values():
             dev.publish_update()
             
-    def send_request(self,request):
-        async def send():
-            self.writer.write(request)
-            await self.writer.drain()
-        self.loop.create_task(send())
+    async def _write_tcp_messages(self):
+        while not self.shutting_down:
+            queued = [await self._write_queue.get()]
+            #coalesce every request queued since the last write into a single write
+            while not self._write_queue.empty():
+                queued.append(self._write_queue.get_nowait())
+            #drop commands that expired or were superseded, timed out or acknowledged while queued
+            now = self.loop.time()
+            requests = [request for request, seq, expires in queued if seq is None or (expires > now and seq in self.pending_commands and not self.pending_commands[seq].done())]
+            if len(requests) > 0:
+                self._write(b''.join(requests))
+                await self.writer.drain()
+        raise ShuttingDown
+
+    def _write(self, data):
+        if self.capture is not None:
+            self.capture.record(CAPTURE_OUTBOUND, data)
+        self.last_sent = time.time()
+        self.writer.write(data)
+
+    def send_request(self, request, seq = None):
+        """Queue a request for the writer task, requests for a command seq are dropped once the command is no longer pending"""
+        if self._write_queue is not None:
+            expires = self.loop.time() + self.command_ttl if seq is not None else None
+            self._write_queue.put_nowait((request, seq, expires))
         
+    def ping_controller(self, controller):
+        seq = self.get_seq_num()
+        ping = bytes.fromhex('a300000007') + int(controller).to_bytes(4,'big') + seq.to_bytes(2,'big') + bytes.fromhex('00')
+        self.send_request(ping)
+
     def combo_control(self,state,brightness,color_tone,rgb,switch_id,mesh_id,seq):
         combo_request = bytes.fromhex('7300000022') + int(switch_id).to_bytes(4,'big') + int(seq).to_bytes(2,'big') + bytes.fromhex('007e00000000f8f010000000000000') + mesh_id + bytes.fromhex('f00000') + (1 if state else 0).to_bytes(1,'big')  + brightness.to_bytes(1,'big') + color_tone.to_bytes(1,'big') + rgb[0].to_bytes(1,'big') + rgb[1].to_bytes(1,'big') + rgb[2].to_bytes(1,'big') + ((496 + int(mesh_id[0]) + int(mesh_id[1]) + (1 if state else 0) + brightness + color_tone + sum(rgb))%256).to_bytes(1,'big') + bytes.fromhex('7e')
-        self.loop.call_soon_threadsafe(self.send_request,combo_request)
+        self.send_request(combo_request, seq)
 
     def turn_on(self,switch_id,mesh_id,seq):
         power_request = bytes.fromhex('730000001f') + int(switch_id).to_bytes(4,'big') + int(seq).to_bytes(2,'big') + bytes.fromhex('007e00000000f8d00d000000000000') + mesh_id + bytes.fromhex('d00000010000') + ((430 + int(mesh_id[0]) + int(mesh_id[1]))%256).to_bytes(1,'big') + bytes.fromhex('7e')
-        self.loop.call_soon_threadsafe(self.send_request,power_request)
+        self.send_request(power_request, seq)
 
     def turn_off(self,switch_id,mesh_id,seq):
         power_request = bytes.fromhex('730000001f') + int(switch_id).to_bytes(4,'big') + int(seq).to_bytes(2,'big') + bytes.fromhex('007e00000000f8d00d000000000000') + mesh_id + bytes.fromhex('d00000000000') + ((429 + int(mesh_id[0]) + int(mesh_id[1]))%256).to_bytes(1,'big') + bytes.fromhex('7e')
-        self.loop.call_soon_threadsafe(self.send_request,power_request)
+        self.send_request(power_request, seq)
 
     def set_color_temp(self,color_temp,switch_id,mesh_id,seq):
         color_temp_request = bytes.fromhex('730000001e') + int(switch_id).to_bytes(4,'big') + int(seq).to_bytes(2,'big') + bytes.fromhex('007e00000000f8e20c000000000000') + mesh_id + bytes.fromhex('e2000005') + color_temp.to_bytes(1,'big') + ((469 + int(mesh_id[0]) + int(mesh_id[1]) + color_temp)%256).to_bytes(1,'big') + bytes.fromhex('7e')
-        self.loop.call_soon_threadsafe(self.send_request,color_temp_request)
+        self.send_request(color_temp_request, seq)
+
+    async def send_command(self, target, send):
+        """Send a command to a switch or room, retrying over its controllers, healthiest first, until the Cync server acknowledges it.
+
+        Returns True when the command was acknowledged, False when it timed out and None when a newer command for the same target superseded it.
+        """
+        loop = asyncio.get_running_loop()
+        controllers = self.rank_controllers(target.controllers) if len(target.controllers) > 0 else [str(target.default_controller)]
+        home_stats = self.home_command_stats.setdefault(target.home_id, CommandStats())
+        attempts = 0
+        while attempts < int(target._command_retry_time/target._command_timout):
+            seq = str(self.get_seq_num())
+            controller = controllers[attempts%len(controllers)]
+            health = self.controller_health.setdefault(controller, ControllerHealth())
+            stats = self.controller_command_stats.setdefault(controller, CommandStats())
+            stats.record_sent(attempts > 0)
+            home_stats.record_sent(attempts > 0)
+            sent = loop.time()
+            echo = [sent, stats, home_stats]
+            self._expect_echo(target, echo)
+            command_received = loop.create_future()
+            self.pending_commands[seq] = command_received
+            self.pending_command_sent[seq] = sent
+            #a newer command for the same target supersedes any retries of the previous one
+            if target._pending_command is not None and not target._pending_command.done():
+                target._pending_command.set_result(None)
+            target._pending_command = command_received
+            try:
+                send(controller, seq)
+                acknowledged = await asyncio.wait_for(command_received, target._command_timout)
+            except asyncio.TimeoutError:
+                health.record_timeout()
+                stats.timeouts += 1
+                home_stats.timeouts += 1
+                attempts += 1
+            except Exception:
+                self._cancel_echo(echo)
+                raise
+            else:
+                if acknowledged:
+                    latency = loop.time() - sent
+                    health.record_ack(latency)
+                    stats.record_ack(latency)
+                    home_stats.record_ack(latency)
+                return acknowledged
+            finally:
+                self.pending_commands.pop(seq, None)
+                self.pending_command_sent.pop(seq, None)
+                if target._pending_command is command_received:
+                    target._pending_command = None
+        if attempts > 0:
+            stats.failed += 1
+            home_stats.failed += 1
+        return False
+
+    def _expect_echo(self, target, echo):
+        """Wait for the state of the switches a command was sent to, echo is shared by all of them and only recorded once"""
+        if isinstance(target, CyncRoom):
+            for device_id in target.switches + [device_id for subgroup in target.subgroups if subgroup in self.cync_rooms for device_id in self.cync_rooms[subgroup].switches]:
+                if device_id in self.cync_switches:
+                    self._awaiting_echo[self.cync_switches[device_id]] = echo
+        else:
+            self._awaiting_echo[target] = echo
+
+    def _cancel_echo(self, echo):
+        """Stop waiting for the echo of a command that could not be sent"""
+        for switch in [switch for switch, awaiting in self._awaiting_echo.items() if awaiting is echo]:
+            del self._awaiting_echo[switch]
+
+    def _record_echo(self, switch):
+        echo = self._awaiting_echo.pop(switch)
+        sent, stats, home_stats = echo
+        if sent is not None:
+            echo[0] = None
+            latency = self.loop.time() - sent
+            #state reported long after a command that was never echoed is not an echo
+            if latency <= ECHO_TIMEOUT:
+                stats.echo_latency.record(latency)
+                home_stats.echo_latency.record(latency)
+
+    async def bulk_set(self, commands):
+        """Send commands to several switches and rooms concurrently.
+
+        commands is a list of (target, state, attr_rgb, attr_br, attr_ct) tuples. Only the last command for a target is
+        sent. The result has COMMAND_ACKNOWLEDGED, COMMAND_SUPERSEDED, COMMAND_TIMEOUT or COMMAND_FAILED for every command.
+        """
+        results = [COMMAND_SUPERSEDED]*len(commands)
+        last_command = {target: index for index, (target, state, attr_rgb, attr_br, attr_ct) in enumerate(commands)}
+        order = sorted(last_command.values())
+        dispatched = []
+        for index in order:
+            target, state, attr_rgb, attr_br, attr_ct = commands[index]
+            dispatched.append(target.turn_on(attr_rgb, attr_br, attr_ct) if state else target.turn_off())
+        #commands queued together share the writer task's next socket write, whichever controller they go through
+        for index, result in zip(order, await asyncio.gather(*dispatched, return_exceptions=True)):
+            if isinstance(result, Exception):
+                _LOGGER.error(str(type(result).__name__) + ": " + str(result))
+                results[index] = COMMAND_FAILED
+            elif result is None:
+                results[index] = COMMAND_SUPERSEDED
+            else:
+                results[index] = COMMAND_ACKNOWLEDGED if result else COMMAND_TIMEOUT
+        return results
+
+    def rank_controllers(self, controllers):
+        """Order controllers by health, demoted controllers last, keeping the routing order between equally healthy ones"""
+        controller_health = self.controller_health
+        return sorted(controllers, key = lambda controller: controller_health[controller].rank if controller in controller_health else (False, 0))
+
+    def find_target(self, unique_id):
+        """Return the switch or room represented by the entity with this unique id"""
+        if unique_id.startswith('cync_switch_'):
+            return self.cync_switches.get(unique_id[len('cync_switch_'):])
+        return next((room for room in self.cync_rooms.values() if room.unique_id == unique_id), None)
+
+    def command_diagnostics(self):
+        """Sequence number, write queue depth and the commands still waiting for their ack or echo"""
+        now = self.loop.time() if self.loop is not None else None
+        return {
+            "seq": self._seq_num,
+            "write_queue": self._write_queue.qsize() if self._write_queue is not None else 0,
+            "pending": len(self.pending_commands),
+            "pending_age": {seq: round(now - sent, 3) for seq, sent in self.pending_command_sent.items()} if now is not None else {},
+            "awaiting_echo": len(self._awaiting_echo),
+        }
 
     def get_seq_num(self):
         if self._seq_num == 65535:
@@ -323,25 +1095,25 @@ class CyncHub:
 
 class CyncRoom:
 
+    __slots__ = ('hub', 'room_id', 'home_id', 'name', 'home_name', 'parent_room', 'mesh_id', 'power_state', 'brightness',
+        'color_temp', 'rgb', 'switches', 'subgroups', 'is_subgroup', 'all_room_switches', 'controllers', 'default_controller',
+        '_update_callback', '_update_parent_room', 'support_brightness', 'support_color_temp', 'support_rgb',
+        'switches_support_brightness', 'switches_support_color_temp', 'switches_support_rgb', 'groups_support_brightness',
+        'groups_support_color_temp', 'groups_support_rgb', '_color_temp_members', '_rgb_members', '_members_on',
+        '_brightness_sum', '_color_temp_sum', '_rgb_sum', '_rgb_active', '_command_timout', '_command_retry_time',
+        '_pending_command')
+
     def __init__(self, room_id, room_info, hub):
 
         self.hub = hub
         self.room_id = room_id
         self.home_id = room_id.split('-')[0]
-        self.name = room_info.get('name','unknown')
-        self.home_name = room_info.get('home_name','unknown')
-        self.parent_room = room_info.get('parent_room', 'unknown')
-        self.mesh_id = int(room_info.get('mesh_id',0)).to_bytes(2,'little')
         self.power_state = False
         self.brightness = 0
         self.color_temp = 0
-        self.rgb = {'r':0, 'g':0, 'b':0, 'active': False}
-        self.switches = room_info.get('switches',[])
-        self.subgroups = room_info.get('subgroups',[])
-        self.is_subgroup = room_info.get('isSubgroup', False)
-        self.all_room_switches = self.switches
+        self.rgb = NO_COLOR
         self.controllers = []
-        self.default_controller = room_info.get('room_controller',self.hub.home_controllers[self.home_id][0])
+        self.update_info(room_info)
         self._update_callback = None
         self._update_parent_room = None
         self.support_brightness = False
@@ -353,8 +1125,28 @@ class CyncRoom:
         self.groups_support_brightness = False
         self.groups_support_color_temp = False
         self.groups_support_rgb = False
+        self._color_temp_members = set()
+        self._rgb_members = set()
+        self._members_on = 0
+        self._brightness_sum = 0
+        self._color_temp_sum = 0
+        self._rgb_sum = [0, 0, 0]
+        self._rgb_active = 0
         self._command_timout = 0.5
         self._command_retry_time = 5
+        self._pending_command = None
+
+    def update_info(self, room_info):
+        """Apply the room configuration from the Cync cloud, initialize() must be called again afterwards"""
+        self.name = room_info.get('name','unknown')
+        self.home_name = room_info.get('home_name','unknown')
+        self.parent_room = room_info.get('parent_room', 'unknown')
+        self.mesh_id = int(room_info.get('mesh_id',0)).to_bytes(2,'little')
+        self.switches = room_info.get('switches',[])
+        self.subgroups = room_info.get('subgroups',[])
+        self.is_subgroup = room_info.get('isSubgroup', False)
+        self.all_room_switches = self.switches
+        self.default_controller = room_info.get('room_controller',self.hub.home_controllers[self.home_id][0])
 
     def initialize(self):
         """Initialization of supported features and registration of update function for all switches and subgroups in the room"""
@@ -374,6 +1166,19 @@ class CyncRoom:
             self.all_room_switches = self.all_room_switches + self.hub.cync_rooms[subgroup].switches
         for subgroup in self.subgroups:
             self.hub.cync_rooms[subgroup].all_room_switches = self.all_room_switches
+        self._color_temp_members = set([self.hub.cync_switches[device_id] for device_id in self.switches_support_color_temp] + [self.hub.cync_rooms[room_id] for room_id in self.groups_support_color_temp])
+        self._rgb_members = set([self.hub.cync_switches[device_id] for device_id in self.switches_support_rgb] + [self.hub.cync_rooms[room_id] for room_id in self.groups_support_rgb])
+        self.recompute_room()
+
+    def recompute_room(self):
+        """Rebuild the running totals of the room from the current state of all its switches and subgroups"""
+        members = [self.hub.cync_switches[device_id] for device_id in self.switches] + [self.hub.cync_rooms[room_id] for room_id in self.subgroups]
+        self._members_on = sum([1 for member in members if member.power_state])
+        self._brightness_sum = sum([member.brightness for member in members])
+        self._color_temp_sum = sum([member.color_temp for member in self._color_temp_members])
+        self._rgb_sum = [sum([member.rgb[color] for member in self._rgb_members]) for color in range(3)]
+        self._rgb_active = sum([1 for member in self._rgb_members if member.rgb.active])
+        self._publish_room_state()
 
     def register(self, update_callback) -> None:
         """Register callback, called when switch changes state."""
@@ -386,28 +1191,26 @@ class CyncRoom:
     def register_room_updater(self, parent_updater):
         self._update_parent_room = parent_updater
 
+    @property
+    def unique_id(self) -> str:
+        """Return Unique ID string of the room entity."""
+        return 'cync_room_' + '-'.join(self.switches) + '_' + '-'.join(self.subgroups)
+
     @property
     def max_mireds(self) -> int:
         """Return minimum supported color temperature."""
-        return 500
+        return MAX_MIREDS
 
     @property
     def min_mireds(self) -> int:
         """Return maximum supported color temperature."""
-        return 200
+        return MIN_MIREDS
 
-    async def turn_on(self, attr_rgb, attr_br, attr_ct) -> None:
-        """Turn on the light."""
-        attempts = 0
-        update_received = False
-        while not update_received and attempts < int(self._command_retry_time/self._command_timout):
-            seq = str(self.hub.get_seq_num())
-            if len(self.controllers) > 0:
-                controller = self.controllers[attempts%len(self.controllers)]
-            else:
-                controller = self.default_controller
+    async def turn_on(self, attr_rgb, attr_br, attr_ct) -> bool:
+        """Turn on the light, return True once the command is acknowledged."""
+        def send(controller, seq):
             if attr_rgb is not None and attr_br is not None:
-                if math.isclose(attr_br, max([self.rgb['r'],self.rgb['g'],self.rgb['b']])*self.brightness/100, abs_tol = 2):
+                if math.isclose(attr_br, max(self.rgb.r, self.rgb.g, self.rgb.b)*self.brightness/100, abs_tol = 2):
                     self.hub.combo_control(True, self.brightness, 254, attr_rgb, controller, self.mesh_id, seq)
                 else:
                     self.hub.combo_control(True, round(attr_br*100/255), 255, [255,255,255], controller, self.mesh_id, seq)
@@ -416,69 +1219,61 @@ class CyncRoom:
             elif attr_rgb is not None and attr_br is None:
                 self.hub.combo_control(True, self.brightness, 254, attr_rgb, controller, self.mesh_id, seq)
             elif attr_ct is not None:
-                ct = round(100*(self.max_mireds - attr_ct)/(self.max_mireds - self.min_mireds))
+                ct = min(100, max(0, round(100*(self.max_mireds - attr_ct)/(self.max_mireds - self.min_mireds))))
                 self.hub.turn_on(controller, self.mesh_id, seq)
                 self.hub.set_color_temp(ct, controller, self.mesh_id, seq)
             else:
                 self.hub.turn_on(controller, self.mesh_id, seq)
-            self.hub.pending_commands[seq] = self.command_received
-            await asyncio.sleep(self._command_timout)
-            if self.hub.pending_commands.get(seq, None) is not None:
-                self.hub.pending_commands.pop(seq)
-                attempts += 1
-            else:
-                update_received = True
+        return await self.hub.send_command(self, send)
 
-    async def turn_off(self, **kwargs: Any) -> None:
-        """Turn off the light."""
-        attempts = 0
-        update_received = False
-        while not update_received and attempts < int(self._command_retry_time/self._command_timout):
-            seq = str(self.hub.get_seq_num())
-            if len(self.controllers) > 0:
-                controller = self.controllers[attempts%len(self.controllers)]
-            else:
-                controller = self.default_controller
+    async def turn_off(self, **kwargs: Any) -> bool:
+        """Turn off the light, return True once the command is acknowledged."""
+        def send(controller, seq):
             self.hub.turn_off(controller, self.mesh_id, seq)
-            self.hub.pending_commands[seq] = self.command_received
-            await asyncio.sleep(self._command_timout)
-            if self.hub.pending_commands.get(seq, None) is not None:
-                self.hub.pending_commands.pop(seq)
-                attempts += 1
-            else:
-                update_received = True
-
-    def command_received(self, seq):
-        """Remove command from hub.pending_commands when a reply is received from Cync server"""
-        if self.hub.pending_commands.get(seq) is not None:
-            self.hub.pending_commands.pop(seq)
-
-    def update_room(self):
-        """Update the current state of the room"""
-        _brightness = self.brightness
-        _color_temp = self.color_temp
-        _rgb = self.rgb
-        _power_state = True in ([self.hub.cync_switches[device_id].power_state for device_id in self.switches] + [self.hub.cync_rooms[room_id].power_state for room_id in self.subgroups])
+        return await self.hub.send_command(self, send)
+
+    def update_room(self, member, previous_state):
+        """Update the current state of the room from the change of one switch or subgroup.
+
+        previous_state is the (power_state, brightness, color_temp, rgb) of the member before the change.
+        """
+        power_state, brightness, color_temp, rgb = previous_state
+        self._members_on += member.power_state - power_state
+        self._brightness_sum += member.brightness - brightness
+        if member in self._color_temp_members:
+            self._color_temp_sum += member.color_temp - color_temp
+        if member in self._rgb_members:
+            member_rgb = member.rgb
+            self._rgb_sum[0] += member_rgb.r - rgb.r
+            self._rgb_sum[1] += member_rgb.g - rgb.g
+            self._rgb_sum[2] += member_rgb.b - rgb.b
+            self._rgb_active += member_rgb.active - rgb.active
+        self.hub.queue_room_update(self)
+
+    def _publish_room_state(self):
+        """Derive the room state from the running totals and publish it if it changed"""
+        _power_state = self._members_on > 0
         if self.support_brightness:
-            _brightness = round(sum([self.hub.cync_switches[device_id].brightness for device_id in self.switches] + [self.hub.cync_rooms[room_id].brightness for room_id in self.subgroups])/(len(self.switches) + len(self.subgroups)))
+            _brightness = round(self._brightness_sum/max(len(self.switches) + len(self.subgroups), 1))
         else:
             _brightness = 100 if _power_state else 0
+        _color_temp = self.color_temp
         if self.support_color_temp:
-            _color_temp = round(sum([self.hub.cync_switches[device_id].color_temp for device_id in self.switches_support_color_temp] + [self.hub.cync_rooms[room_id].color_temp for room_id in self.groups_support_color_temp])/(len(self.switches_support_color_temp) + len(self.groups_support_color_temp)))
+            _color_temp = round(self._color_temp_sum/len(self._color_temp_members))
+        _rgb = self.rgb
         if self.support_rgb:
-            _rgb['r'] = round(sum([self.hub.cync_switches[device_id].rgb['r'] for device_id in self.switches_support_rgb] + [self.hub.cync_rooms[room_id].rgb['r'] for room_id in self.groups_support_rgb])/(len(self.switches_support_rgb) + len(self.groups_support_rgb)))
-            _rgb['g'] = round(sum([self.hub.cync_switches[device_id].rgb['g'] for device_id in self.switches_support_rgb] + [self.hub.cync_rooms[room_id].rgb['g'] for room_id in self.groups_support_rgb])/(len(self.switches_support_rgb) + len(self.groups_support_rgb)))
-            _rgb['b'] = round(sum([self.hub.cync_switches[device_id].rgb['b'] for device_id in self.switches_support_rgb] + [self.hub.cync_rooms[room_id].rgb['b'] for room_id in self.groups_support_rgb])/(len(self.switches_support_rgb) + len(self.groups_support_rgb)))
-            _rgb['active'] = True in ([self.hub.cync_switches[device_id].rgb['active'] for device_id in self.switches_support_rgb] + [self.hub.cync_rooms[room_id].rgb['active'] for room_id in self.groups_support_rgb])
-        
+            rgb_members = len(self._rgb_members)
+            _rgb = CyncColor(round(self._rgb_sum[0]/rgb_members), round(self._rgb_sum[1]/rgb_members), round(self._rgb_sum[2]/rgb_members), self._rgb_active > 0)
+
         if _power_state != self.power_state or _brightness != self.brightness or _color_temp != self.color_temp or _rgb != self.rgb:
+            previous_state = (self.power_state, self.brightness, self.color_temp, self.rgb)
             self.power_state = _power_state
             self.brightness = _brightness
             self.color_temp = _color_temp
             self.rgb = _rgb
             self.publish_update()
             if self._update_parent_room:
-                self._update_parent_room()
+                self._update_parent_room(self, previous_state)
 
     def update_controllers(self):
         """Update the list of responsive, Wi-Fi connected controller devices"""
@@ -486,45 +1281,54 @@ class CyncRoom:
         controllers = []
         if len(connected_devices) > 0:
             controllers = [self.hub.cync_switches[dev_id].switch_id for dev_id in self.all_room_switches if dev_id in connected_devices]
-            others_available = [self.hub.cync_switches[dev_id].switch_id for dev_id in connected_devices]
-            for controller in controllers:
-                if controller in others_available:
-                    others_available.remove(controller)
-            self.controllers = controllers + others_available
+            preferred = set(controllers)
+            self.controllers = controllers + [controller for controller in self.hub.connected_controllers[self.home_id] if controller not in preferred]
         else:
-            self.controllers = [self.default_controller]
+            self.controllers = [str(self.default_controller)]
 
     def publish_update(self):
         if self._update_callback:
-            self._update_callback()
+            self.hub.dispatcher.publish(self)
 
 class CyncSwitch:
 
+    __slots__ = ('hub', 'device_id', 'switch_id', 'home_id', 'name', 'home_name', 'mesh_id', 'room', 'power_state', 'brightness',
+        'color_temp', 'rgb', 'default_controller', 'controllers', '_update_callback', '_update_parent_room',
+        'support_brightness', 'support_color_temp', 'support_rgb', 'plug', 'fan', 'elements', '_command_timout',
+        '_command_retry_time', '_pending_command', 'update_received', 'restored')
+
     def __init__(self, device_id, switch_info, room, hub):
         self.hub = hub
         self.device_id = device_id
-        self.switch_id = switch_info.get('switch_id','0')
-        self.home_id = [home_id for home_id, home_devices in self.hub.home_devices.items() if self.device_id in home_devices][0]
-        self.name = switch_info.get('name','unknown')
-        self.home_name = switch_info.get('home_name','unknown')
-        self.mesh_id = switch_info.get('mesh_id',0).to_bytes(2,'little')
-        self.room = room
         self.power_state = False
         self.brightness = 0
         self.color_temp = 0
-        self.rgb = {'r':0, 'g':0, 'b':0, 'active':False}
-        self.default_controller = switch_info.get('switch_controller',self.hub.home_controllers[self.home_id][0])
+        self.rgb = NO_COLOR
         self.controllers = []
         self._update_callback = None
         self._update_parent_room = None
+        self._command_timout = 0.5
+        self._command_retry_time = 5
+        self._pending_command = None
+        self.update_received = False
+        self.restored = False
+        self.update_info(switch_info, room)
+
+    def update_info(self, switch_info, room):
+        """Apply the switch configuration from the Cync cloud"""
+        self.switch_id = switch_info.get('switch_id','0')
+        self.home_id = self.hub.device_homes[self.device_id]
+        self.name = switch_info.get('name','unknown')
+        self.home_name = switch_info.get('home_name','unknown')
+        self.mesh_id = switch_info.get('mesh_id',0).to_bytes(2,'little')
+        self.room = room
+        self.default_controller = switch_info.get('switch_controller',self.hub.home_controllers[self.home_id][0])
         self.support_brightness = switch_info.get('BRIGHTNESS',False)
         self.support_color_temp = switch_info.get('COLORTEMP',False)
         self.support_rgb = switch_info.get('RGB',False)
         self.plug = switch_info.get('PLUG',False)
         self.fan = switch_info.get('FAN',False)
         self.elements = switch_info.get('MULTIELEMENT',1)
-        self._command_timout = 0.5
-        self._command_retry_time = 5
 
     def register(self, update_callback) -> None:
         """Register callback, called when switch changes state."""
@@ -540,25 +1344,18 @@ class CyncSwitch:
     @property
     def max_mireds(self) -> int:
         """Return minimum supported color temperature."""
-        return 500
+        return MAX_MIREDS
 
     @property
     def min_mireds(self) -> int:
         """Return maximum supported color temperature."""
-        return 200
+        return MIN_MIREDS
 
-    async def turn_on(self, attr_rgb, attr_br, attr_ct) -> None:
-        """Turn on the light."""
-        attempts = 0
-        update_received = False
-        while not update_received and attempts < int(self._command_retry_time/self._command_timout):
-            seq = str(self.hub.get_seq_num())
-            if len(self.controllers) > 0:
-                controller = self.controllers[attempts%len(self.controllers)]
-            else:
-                controller = self.default_controller
+    async def turn_on(self, attr_rgb, attr_br, attr_ct) -> bool:
+        """Turn on the light, return True once the command is acknowledged."""
+        def send(controller, seq):
             if attr_rgb is not None and attr_br is not None:
-                if math.isclose(attr_br, max([self.rgb['r'],self.rgb['g'],self.rgb['b']])*self.brightness/100, abs_tol = 2):
+                if math.isclose(attr_br, max(self.rgb.r, self.rgb.g, self.rgb.b)*self.brightness/100, abs_tol = 2):
                     self.hub.combo_control(True, self.brightness, 254, attr_rgb, controller, self.mesh_id, seq)
                 else:
                     self.hub.combo_control(True, round(attr_br*100/255), 255, [255,255,255], controller, self.mesh_id, seq)
@@ -567,53 +1364,27 @@ class CyncSwitch:
             elif attr_rgb is not None and attr_br is None:
                 self.hub.combo_control(True, self.brightness, 254, attr_rgb, controller, self.mesh_id, seq)
             elif attr_ct is not None:
-                ct = round(100*(self.max_mireds - attr_ct)/(self.max_mireds - self.min_mireds))
+                ct = min(100, max(0, round(100*(self.max_mireds - attr_ct)/(self.max_mireds - self.min_mireds))))
                 self.hub.set_color_temp(ct, controller, self.mesh_id, seq)
             else:
                 self.hub.turn_on(controller, self.mesh_id, seq)
-            self.hub.pending_commands[seq] = self.command_received
-            await asyncio.sleep(self._command_timout)
-            if self.hub.pending_commands.get(seq, None) is not None:
-                self.hub.pending_commands.pop(seq)
-                attempts += 1
-            else:
-                update_received = True
+        return await self.hub.send_command(self, send)
 
-    async def turn_off(self, **kwargs: Any) -> None:
-        """Turn off the light."""
-        attempts = 0
-        update_received = False
-        while not update_received and attempts < int(self._command_retry_time/self._command_timout):
-            seq = str(self.hub.get_seq_num())
-            if len(self.controllers) > 0:
-                controller = self.controllers[attempts%len(self.controllers)]
-            else:
-                controller = self.default_controller
+    async def turn_off(self, **kwargs: Any) -> bool:
+        """Turn off the light, return True once the command is acknowledged."""
+        def send(controller, seq):
             self.hub.turn_off(controller, self.mesh_id, seq)
-            self.hub.pending_commands[seq] = self.command_received
-            await asyncio.sleep(self._command_timout)
-            if self.hub.pending_commands.get(seq, None) is not None:
-                self.hub.pending_commands.pop(seq)
-                attempts += 1
-            else:
-                update_received = True
-
-    def command_received(self, seq):
-        """Remove command from hub.pending_commands when a reply is received from Cync server"""
-        if self.hub.pending_commands.get(seq) is not None:
-            self.hub.pending_commands.pop(seq)
+        return await self.hub.send_command(self, send)
 
     def update_switch(self,state,brightness,color_temp,rgb):
-        """Update the state of the switch as updates are received from the Cync server"""
+        """Update the state of the switch as updates are received from the Cync server, published by the next CyncHub.flush_updates"""
         self.update_received = True
         if self.power_state != state or self.brightness != brightness or self.color_temp != color_temp or self.rgb != rgb:
+            self.hub.queue_switch_update(self, (self.power_state, self.brightness, self.color_temp, self.rgb))
             self.power_state = state
             self.brightness = brightness if self.support_brightness and state else 100 if state else 0
             self.color_temp = color_temp 
             self.rgb = rgb
-            self.publish_update()
-            if self._update_parent_room:
-                self._update_parent_room()
 
     def update_controllers(self):
         """Update the list of responsive, Wi-Fi connected controller devices"""
@@ -626,28 +1397,32 @@ class CyncSwitch:
                     controllers.append(self.switch_id)
             if self.room:
                 controllers = controllers + [self.hub.cync_switches[device_id].switch_id for device_id in self.room.all_room_switches if device_id in connected_devices and device_id != self.device_id]
-            others_available = [self.hub.cync_switches[device_id].switch_id for device_id in connected_devices]
-            for controller in controllers:
-                if controller in others_available:
-                    others_available.remove(controller)
-            self.controllers = controllers + others_available
+            preferred = set(controllers)
+            self.controllers = controllers + [controller for controller in self.hub.connected_controllers[self.home_id] if controller not in preferred]
         else:
-            self.controllers = [self.default_controller]
+            self.controllers = [str(self.default_controller)]
 
     def publish_update(self):
         if self._update_callback:
-            self._update_callback()
+            self.hub.dispatcher.publish(self)
 
 class CyncMotionSensor:
 
-    def __init__(self, device_id, device_info, room):
+    __slots__ = ('hub', 'device_id', 'name', 'home_name', 'room', 'motion', '_update_callback')
+
+    def __init__(self, device_id, device_info, room, hub):
         
+        self.hub = hub
         self.device_id = device_id
+        self.motion = False
+        self._update_callback = None
+        self.update_info(device_info, room)
+
+    def update_info(self, device_info, room):
+        """Apply the sensor configuration from the Cync cloud"""
         self.name = device_info['name']
         self.home_name = device_info['home_name']
         self.room = room
-        self.motion = False
-        self._update_callback = None
 
     def register(self, update_callback) -> None:
         """Register callback, called when switch changes state."""
@@ -663,18 +1438,25 @@ class CyncMotionSensor:
 
     def publish_update(self):
         if self._update_callback:
-            self._update_callback()
+            self.hub.dispatcher.publish(self)
 
 class CyncAmbientLightSensor:
 
-    def __init__(self, device_id, device_info, room):
+    __slots__ = ('hub', 'device_id', 'name', 'home_name', 'room', 'ambient_light', '_update_callback')
+
+    def __init__(self, device_id, device_info, room, hub):
         
+        self.hub = hub
         self.device_id = device_id
+        self.ambient_light = False
+        self._update_callback = None
+        self.update_info(device_info, room)
+
+    def update_info(self, device_info, room):
+        """Apply the sensor configuration from the Cync cloud"""
         self.name = device_info['name']
         self.home_name = device_info['home_name']
         self.room = room
-        self.ambient_light = False
-        self._update_callback = None
 
     def register(self, update_callback) -> None:
         """Register callback, called when switch changes state."""
@@ -690,51 +1472,67 @@ class CyncAmbientLightSensor:
 
     def publish_update(self):
         if self._update_callback:
-            self._update_callback()
+            self.hub.dispatcher.publish(self)
 
 class CyncUserData:
 
-    def __init__(self):
+    def __init__(self, session = None):
         self.username = ''
         self.password = ''
         self.auth_code = None
         self.user_credentials = {}
+        self._session = session
+        self._owns_session = session is None
 
-    async def authenticate(self,username,password):
-        """Authenticate with the API and get a token."""
+    @property
+    def session(self):
+        """HTTP session shared by every request, created on first use when none was given"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        """Close the HTTP session if it was created by this object"""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def use_credentials(self, user_credentials):
+        """Use the credentials of an earlier login, requests fail with AccessTokenExpired once their token is no longer accepted."""
+        self.user_credentials = user_credentials
+        login_code = bytearray.fromhex('13000000') + (10 + len(self.user_credentials['authorize'])).to_bytes(1,'big') + bytearray.fromhex('03') + self.user_credentials['user_id'].to_bytes(4,'big') + len(self.user_credentials['authorize']).to_bytes(2,'big') + bytearray(self.user_credentials['authorize'],'ascii') + bytearray.fromhex('0000b4')
+        self.auth_code = [int.from_bytes([byt],'big') for byt in login_code]
+
+    async def authenticate(self,username,password,request_two_factor_code = True):
+        """Authenticate with the API and get a token, a two factor code is emailed if required and requested."""
         self.username = username
         self.password = password
         auth_data = {'corp_id': "1007d2ad150c4000", 'email': self.username, 'password': self.password}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(API_AUTH, json=auth_data) as resp:
-                if resp.status == 200:
-                    self.user_credentials = await resp.json()
-                    login_code = bytearray.fromhex('13000000') + (10 + len(self.user_credentials['authorize'])).to_bytes(1,'big') + bytearray.fromhex('03') + self.user_credentials['user_id'].to_bytes(4,'big') + len(self.user_credentials['authorize']).to_bytes(2,'big') + bytearray(self.user_credentials['authorize'],'ascii') + bytearray.fromhex('0000b4')
-                    self.auth_code = [int.from_bytes([byt],'big') for byt in login_code]
-                    return {'authorized':True}
-                elif resp.status == 400:
-                    request_code_data = {'corp_id': "1007d2ad150c4000", 'email': self.username, 'local_lang': "en-us"}
-                    async with aiohttp.ClientSession() as session:
-                        async with session.post(API_REQUEST_CODE,json=request_code_data) as resp:
-                            if resp.status == 200:                    
-                                return {'authorized':False,'two_factor_code_required':True}
-                            else:
-                                return {'authorized':False,'two_factor_code_required':False}
-                else:
-                    return {'authorized':False,'two_factor_code_required':False}
+        async with self.session.post(API_AUTH, json=auth_data) as resp:
+            if resp.status == 200:
+                self.use_credentials(await resp.json())
+                return {'authorized':True}
+            elif resp.status == 400 and not request_two_factor_code:
+                return {'authorized':False,'two_factor_code_required':True}
+            elif resp.status == 400:
+                request_code_data = {'corp_id': "1007d2ad150c4000", 'email': self.username, 'local_lang': "en-us"}
+                async with self.session.post(API_REQUEST_CODE,json=request_code_data) as resp:
+                    if resp.status == 200:                    
+                        return {'authorized':False,'two_factor_code_required':True}
+                    else:
+                        return {'authorized':False,'two_factor_code_required':False}
+            else:
+                return {'authorized':False,'two_factor_code_required':False}
 
     async def auth_two_factor(self, code):
         """Authenticate with 2 Factor Code."""
         two_factor_data = {'corp_id': "1007d2ad150c4000", 'email': self.username,'password': self.password, 'two_factor': code, 'resource':"abcdefghijklmnop"}
-        async with aiohttp.ClientSession() as session:
-            async with session.post(API_2FACTOR_AUTH,json=two_factor_data) as resp:
-                if resp.status == 200:
-                    self.user_credentials = await resp.json()
-                    login_code = bytearray.fromhex('13000000') + (10 + len(self.user_credentials['authorize'])).to_bytes(1,'big') + bytearray.fromhex('03') + self.user_credentials['user_id'].to_bytes(4,'big') + len(self.user_credentials['authorize']).to_bytes(2,'big') + bytearray(self.user_credentials['authorize'],'ascii') + bytearray.fromhex('0000b4')
-                    self.auth_code = [int.from_bytes([byt],'big') for byt in login_code]
-                    return {'authorized':True}
-                else:
-                    return {'authorized':False}
+        async with self.session.post(API_2FACTOR_AUTH,json=two_factor_data) as resp:
+            if resp.status == 200:
+                self.use_credentials(await resp.json())
+                return {'authorized':True}
+            else:
+                return {'authorized':False}
 
     async def get_cync_config(self):
         home_devices = {}
@@ -743,8 +1541,13 @@ class CyncUserData:
         devices = {}
         rooms = {}
         homes = await self._get_homes()
-        for home in homes:
-            home_info = await self._get_home_properties(home['product_id'], home['id'])
+        #home properties are fetched concurrently, at most MAX_CONCURRENT_REQUESTS at a time
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        async def get_home_properties(home):
+            async with semaphore:
+                return await self._get_home_properties(home['product_id'], home['id'])
+        homes_info = await asyncio.gather(*[get_home_properties(home) for home in homes])
+        for home, home_info in zip(homes, homes_info):
             if home_info.get('groupsArray',False) and home_info.get('bulbsArray',False) and len(home_info['groupsArray']) > 0 and len(home_info['bulbsArray']) > 0:
                 home_id = str(home['id'])
                 bulbs_array_length = max([((device['deviceID'] % home['id']) % 1000) + (int((device['deviceID'] % home['id']) / 1000)*256) for device in home_info['bulbsArray']]) + 1
@@ -752,21 +1555,22 @@ class CyncUserData:
                 home_controllers[home_id] = []
                 for device in home_info['bulbsArray']:
                     device_type = device['deviceType']
+                    capabilities = CAPABILITY_MASKS.get(device_type, 0)
                     device_id = str(device['deviceID'])
                     current_index = ((device['deviceID'] % home['id']) % 1000) + (int((device['deviceID'] % home['id']) / 1000)*256)
                     home_devices[home_id][current_index] = device_id
                     devices[device_id] = {'name':device['displayName'],
                         'mesh_id':current_index,
                         'switch_id':str(device.get('switchID',0)), 
-                        'ONOFF': device_type in Capabilities['ONOFF'], 
-                        'BRIGHTNESS': device_type in Capabilities["BRIGHTNESS"], 
-                        "COLORTEMP":device_type in Capabilities["COLORTEMP"], 
-                        "RGB": device_type in Capabilities["RGB"], 
-                        "MOTION": device_type in Capabilities["MOTION"], 
-                        "AMBIENT_LIGHT": device_type in Capabilities["AMBIENT_LIGHT"], 
-                        "WIFICONTROL": device_type in Capabilities["WIFICONTROL"],
-                        "PLUG" : device_type in Capabilities["PLUG"],
-                        "FAN" : device_type in Capabilities["FAN"],
+                        'ONOFF': bool(capabilities & CAPABILITY_ONOFF), 
+                        'BRIGHTNESS': bool(capabilities & CAPABILITY_BRIGHTNESS), 
+                        "COLORTEMP":bool(capabilities & CAPABILITY_COLORTEMP), 
+                        "RGB": bool(capabilities & CAPABILITY_RGB), 
+                        "MOTION": bool(capabilities & CAPABILITY_MOTION), 
+                        "AMBIENT_LIGHT": bool(capabilities & CAPABILITY_AMBIENT_LIGHT), 
+                        "WIFICONTROL": bool(capabilities & CAPABILITY_WIFICONTROL),
+                        "PLUG" : bool(capabilities & CAPABILITY_PLUG),
+                        "FAN" : bool(capabilities & CAPABILITY_FAN),
                         'home_name':home['name'], 
                         'room':'', 
                         'room_name':''
@@ -821,18 +1625,20 @@ class CyncUserData:
     async def _get_homes(self):
         """Get a list of devices for a particular user."""
         headers = {'Access-Token': self.user_credentials['access_token']}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(API_DEVICES.format(user=self.user_credentials['user_id']), headers=headers) as resp:
-                response  = await resp.json()
-                return response
+        async with self.session.get(API_DEVICES.format(user=self.user_credentials['user_id']), headers=headers) as resp:
+            if resp.status in (401, 403):
+                raise AccessTokenExpired
+            response  = await resp.json()
+            return response
 
     async def _get_home_properties(self, product_id, device_id):
         """Get properties for a single device."""
         headers = {'Access-Token': self.user_credentials['access_token']}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(API_DEVICE_INFO.format(product_id=product_id, device_id=device_id), headers=headers) as resp:
-                response = await resp.json()
-                return response
+        async with self.session.get(API_DEVICE_INFO.format(product_id=product_id, device_id=device_id), headers=headers) as resp:
+            if resp.status in (401, 403):
+                raise AccessTokenExpired
+            response = await resp.json()
+            return response
 
 class LostConnection(Exception):
     """Lost connection to Cync Server"""
@@ -842,3 +1648,6 @@ class ShuttingDown(Exception):
 
 class InvalidCyncConfiguration(Exception):
     """Cync configuration is not supported"""
+
+class AccessTokenExpired(Exception):
+    """Cync API no longer accepts the access token"""
@@ -0,0 +1,109 @@
+"""Diagnostics support for the Cync Room Lights integration."""
+from __future__ import annotations
+from typing import Any
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from .const import DOMAIN
+
+#credentials, and the names of homes, rooms and devices in the Cync config, the ids of Wi-Fi connected devices are replaced by pseudonyms
+TO_REDACT = {"cync_credentials", "cync_user_credentials", "username", "password", "name", "home_name", "room_name", "parent_room"}
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return a redacted snapshot of the config entry and the internals of its running hub."""
+    hub = hass.data[DOMAIN][entry.entry_id]
+    cync_config = entry.data.get("cync_config", {})
+    alias = controller_aliases(cync_config)
+    return {
+        "entry": {
+            "data": async_redact_data({key: value for key, value in entry.data.items() if key != "cync_config"}, TO_REDACT),
+            "options": dict(entry.options),
+        },
+        "cync_config": async_redact_data(alias_cync_config(cync_config, alias), TO_REDACT),
+        "connection": {
+            "host": hub.host,
+            "port": hub.tls_port if hub.tls else hub.port,
+            "tls": hub.tls,
+            "connected": hub.writer is not None and not hub.writer.is_closing(),
+            "logged_in": hub.logged_in,
+            "connected_devices_updated": hub.connected_devices_updated,
+            "shutting_down": hub.shutting_down,
+            "last_received": hub.last_received,
+            "last_sent": hub.last_sent,
+            "last_frames": {str(packet_type): received for packet_type, received in sorted(hub.last_frames.items())},
+            "reconnect_history": [reconnect._asdict() for reconnect in hub.reconnect_history],
+            "capturing": hub.capture.path if hub.capture is not None else None,
+        },
+        "commands": {
+            **hub.command_diagnostics(),
+            "homes": {home_id: command_stats(stats) for home_id, stats in hub.home_command_stats.items()},
+            "controllers": {alias(controller): command_stats(stats) for controller, stats in hub.controller_command_stats.items()},
+        },
+        "homes": {
+            home_id: {
+                "connected_devices": sorted(hub.connected_devices.get(home_id, [])),
+                "connected_controllers": [alias(controller) for controller in hub.connected_controllers.get(home_id, [])],
+                "controllers": [alias(controller) for controller in controllers],
+            }
+            for home_id, controllers in hub.home_controllers.items()
+        },
+        "controller_health": {
+            alias(controller): {"success_rate": health.success_rate, "latency": health.latency, "failures": health.failures, "demoted": health.demoted}
+            for controller, health in hub.controller_health.items()
+        },
+        "switches": {
+            device_id: {"controllers": [alias(controller) for controller in switch.controllers], "ranked_controllers": [alias(controller) for controller in hub.rank_controllers(switch.controllers)], "default_controller": alias(switch.default_controller), "power_state": switch.power_state, "brightness": switch.brightness, "update_received": switch.update_received, "restored": switch.restored}
+            for device_id, switch in hub.cync_switches.items()
+        },
+        "rooms": {
+            room_id: {"controllers": [alias(controller) for controller in room.controllers], "ranked_controllers": [alias(controller) for controller in hub.rank_controllers(room.controllers)], "default_controller": alias(room.default_controller), "power_state": room.power_state, "brightness": room.brightness}
+            for room_id, room in hub.cync_rooms.items()
+        },
+    }
+
+def controller_aliases(cync_config):
+    """Return a function that replaces the id of a Wi-Fi connected device with controller_<n>, numbered in the order of the ids in the Cync config"""
+    controllers = {str(controller) for controllers in cync_config.get("home_controllers", {}).values() for controller in controllers}
+    controllers.update(str(device.get("switch_id", "0")) for device in cync_config.get("devices", {}).values())
+    controllers.discard("0")
+    aliases = {controller: f"controller_{index}" for index, controller in enumerate(sorted(controllers, key=int))}
+
+    def alias(controller):
+        #0 is the switch id of devices without Wi-Fi
+        if controller is None or str(controller) == "0":
+            return controller
+        return aliases.setdefault(str(controller), f"controller_{len(aliases)}")
+
+    return alias
+
+def alias_cync_config(cync_config, alias) -> dict[str, Any]:
+    """Copy of the Cync config with the ids of Wi-Fi connected devices replaced by their pseudonyms"""
+    aliased = dict(cync_config)
+    if "devices" in cync_config:
+        aliased["devices"] = {
+            device_id: {key: alias(value) if key in ("switch_id", "switch_controller") else value for key, value in device.items()}
+            for device_id, device in cync_config["devices"].items()
+        }
+    if "rooms" in cync_config:
+        aliased["rooms"] = {
+            room_id: {key: alias(value) if key == "room_controller" else value for key, value in room.items()}
+            for room_id, room in cync_config["rooms"].items()
+        }
+    if "home_controllers" in cync_config:
+        aliased["home_controllers"] = {home_id: [alias(controller) for controller in controllers] for home_id, controllers in cync_config["home_controllers"].items()}
+    if "switchID_to_homeID" in cync_config:
+        aliased["switchID_to_homeID"] = {alias(switch_id): home_id for switch_id, home_id in cync_config["switchID_to_homeID"].items()}
+    return aliased
+
+def command_stats(stats) -> dict[str, Any]:
+    return {
+        "sent": stats.sent,
+        "acked": stats.acked,
+        "retries": stats.retries,
+        "timeouts": stats.timeouts,
+        "failed": stats.failed,
+        "ack_latency": stats.ack_latency.counts,
+        "ack_latency_max": stats.ack_latency.max,
+        "echo_latency": stats.echo_latency.counts,
+        "echo_latency_max": stats.echo_latency.max,
+    }
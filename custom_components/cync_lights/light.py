@@ -18,17 +18,21 @@ async def async_setup_entry(
 ) -> None:
     hub = hass.data[DOMAIN][config_entry.entry_id]
 
-    new_devices = []
-    for room in hub.cync_rooms:
-        if not hub.cync_rooms[room]._update_callback and (room in config_entry.options["rooms"] or room in config_entry.options["subgroups"]):
-            new_devices.append(CyncRoomEntity(hub.cync_rooms[room]))
+    def add_new_entities() -> None:
+        new_devices = []
+        for room in hub.cync_rooms:
+            if not hub.cync_rooms[room]._update_callback and (room in config_entry.options["rooms"] or room in config_entry.options["subgroups"]):
+                new_devices.append(CyncRoomEntity(hub.cync_rooms[room]))
 
-    for switch_id in hub.cync_switches:
-        if not hub.cync_switches[switch_id]._update_callback and not hub.cync_switches[switch_id].plug and not hub.cync_switches[switch_id].fan and switch_id in config_entry.options["switches"]:
-            new_devices.append(CyncSwitchEntity(hub.cync_switches[switch_id]))
+        for switch_id in hub.cync_switches:
+            if not hub.cync_switches[switch_id]._update_callback and not hub.cync_switches[switch_id].plug and not hub.cync_switches[switch_id].fan and switch_id in config_entry.options["switches"]:
+                new_devices.append(CyncSwitchEntity(hub.cync_switches[switch_id]))
 
-    if new_devices:
-        async_add_entities(new_devices)
+        if new_devices:
+            async_add_entities(new_devices)
+
+    hub.entity_adders.append(add_new_entities)
+    add_new_entities()
 
 
 class CyncRoomEntity(LightEntity):
@@ -42,7 +46,7 @@ class CyncRoomEntity(LightEntity):
 
     async def async_added_to_hass(self) -> None:
         """Run when this Entity has been added to HA."""
-        self.room.register(self.schedule_update_ha_state)
+        self.room.register(self.async_write_ha_state)
 
     async def async_will_remove_from_hass(self) -> None:
         """Entity being removed from hass."""
@@ -69,8 +73,7 @@ class CyncRoomEntity(LightEntity):
     @property
     def unique_id(self) -> str:
         """Return Unique ID string."""
-        uid =  'cync_room_' + '-'.join(self.room.switches) + '_' + '-'.join(self.room.subgroups)
-        return uid
+        return self.room.unique_id
 
     @property
     def name(self) -> str:
@@ -105,7 +108,7 @@ class CyncRoomEntity(LightEntity):
     @property
     def rgb_color(self) -> tuple[int, int, int] | None:
         """Return the RGB color tuple of this light switch"""
-        return (self.room.rgb['r'],self.room.rgb['g'],self.room.rgb['b'])
+        return (self.room.rgb.r,self.room.rgb.g,self.room.rgb.b)
 
     @property
     def supported_color_modes(self) -> set[str] | None:
@@ -129,7 +132,7 @@ class CyncRoomEntity(LightEntity):
         """Return the active color mode."""
 
         if self.room.support_color_temp:
-            if self.room.support_rgb and self.room.rgb['active']:
+            if self.room.support_rgb and self.room.rgb.active:
                 return ColorMode.RGB
             else:
                 return ColorMode.COLOR_TEMP
@@ -157,7 +160,7 @@ class CyncSwitchEntity(LightEntity):
 
     async def async_added_to_hass(self) -> None:
         """Run when this Entity has been added to HA."""
-        self.cync_switch.register(self.schedule_update_ha_state)
+        self.cync_switch.register(self.async_write_ha_state)
 
     async def async_will_remove_from_hass(self) -> None:
         """Entity being removed from hass."""
@@ -211,7 +214,7 @@ class CyncSwitchEntity(LightEntity):
     @property
     def rgb_color(self) -> tuple[int, int, int] | None:
         """Return the RGB color tuple of this light switch"""
-        return (self.cync_switch.rgb['r'],self.cync_switch.rgb['g'],self.cync_switch.rgb['b'])
+        return (self.cync_switch.rgb.r,self.cync_switch.rgb.g,self.cync_switch.rgb.b)
 
     @property
     def supported_color_modes(self) -> set[str] | None:
@@ -235,7 +238,7 @@ class CyncSwitchEntity(LightEntity):
         """Return the active color mode."""
 
         if self.cync_switch.support_color_temp:
-            if self.cync_switch.support_rgb and self.cync_switch.rgb['active']:
+            if self.cync_switch.support_rgb and self.cync_switch.rgb.active:
                 return ColorMode.RGB
             else:
                 return ColorMode.COLOR_TEMP
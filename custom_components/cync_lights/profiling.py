@@ -0,0 +1,47 @@
+"""Profile the code running on the event loop with cProfile and optionally tracemalloc.
+
+Nothing is installed until a profile is started, so the hub runs at full speed the rest of the time.
+"""
+import cProfile
+import tracemalloc
+
+TOP_ALLOCATIONS = 50
+
+class LoopProfiler:
+    """cProfile of the thread that calls start() and stop(), with allocations traced by tracemalloc if requested.
+
+    start() and stop() are called from the event loop, write() does the blocking work of taking the allocation
+    snapshot and writing the files and belongs in an executor.
+    """
+
+    def __init__(self, trace_allocations = False):
+        self.trace_allocations = trace_allocations
+        self._profile = cProfile.Profile()
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, pstats_path, allocations_path):
+        """Write the pstats file and, when allocations were traced, the report of the top allocations"""
+        self._profile.dump_stats(pstats_path)
+        if not self.trace_allocations or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        statistics = snapshot.statistics('lineno')
+        cync_statistics = [statistic for statistic in statistics if any('cync_lights' in frame.filename for frame in statistic.traceback)]
+        with open(allocations_path, 'w') as file:
+            file.write(f"Top {TOP_ALLOCATIONS} allocations by line\n")
+            for statistic in statistics[:TOP_ALLOCATIONS]:
+                file.write(str(statistic) + "\n")
+            file.write(f"\nTop {TOP_ALLOCATIONS} allocations by line in cync_lights\n")
+            for statistic in cync_statistics[:TOP_ALLOCATIONS]:
+                file.write(str(statistic) + "\n")
@@ -0,0 +1,210 @@
+"""Platform for sensor integration."""
+from __future__ import annotations
+from datetime import timedelta
+from typing import Any
+from homeassistant.components.sensor import (SensorDeviceClass, SensorEntity, SensorStateClass)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.entity import DeviceInfo
+from .const import DOMAIN
+
+#command statistics are only counted by the hub, entities read them when polled
+SCAN_INTERVAL = timedelta(seconds=60)
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback
+) -> None:
+    hub = hass.data[DOMAIN][config_entry.entry_id]
+    added = {}
+
+    def add_new_entities() -> None:
+        """Add sensors for new homes and controllers and remove the sensors of those no longer in the Cync config"""
+        new_devices = []
+        for home_id in hub.home_controllers:
+            for kind in CyncHomeCommandSensorEntity.kinds:
+                if (home_id, kind) not in added:
+                    added[(home_id, kind)] = entity = CyncHomeCommandSensorEntity(hub, home_id, kind)
+                    new_devices.append(entity)
+        for controller in hub.switchID_to_homeID:
+            if controller not in added:
+                added[controller] = entity = CyncControllerLatencySensorEntity(hub, controller)
+                new_devices.append(entity)
+
+        registry = er.async_get(hass)
+        for key in [key for key in added if (key[0] not in hub.home_controllers if type(key) is tuple else key not in hub.switchID_to_homeID)]:
+            entity = added.pop(key)
+            if entity_id := registry.async_get_entity_id("sensor", DOMAIN, entity.unique_id):
+                registry.async_remove(entity_id)
+
+        if new_devices:
+            async_add_entities(new_devices)
+
+    hub.entity_adders.append(add_new_entities)
+    add_new_entities()
+
+
+def home_device_info(hub, home_id) -> DeviceInfo:
+    """Return device registry information for the Cync server connection of a home."""
+    home_name = next((switch.home_name for switch in hub.home_switches.get(home_id, [])), home_id)
+    return DeviceInfo(
+        identifiers = {(DOMAIN, f"Cync ({home_name})")},
+        manufacturer = "Cync by Savant",
+        name = f"Cync ({home_name})",
+    )
+
+def latency_attributes(histogram) -> dict[str, Any]:
+    """Percentiles in milliseconds and the bucket counts of a latency histogram"""
+    return {
+        "p90": milliseconds(histogram.percentile(0.9)),
+        "p99": milliseconds(histogram.percentile(0.99)),
+        "mean": milliseconds(histogram.mean),
+        "max": milliseconds(histogram.max) if histogram.count else None,
+        "count": histogram.count,
+        "histogram": histogram.counts,
+    }
+
+def milliseconds(seconds) -> float | None:
+    return round(seconds*1000, 1) if seconds is not None else None
+
+class CyncHomeCommandSensorEntity(SensorEntity):
+    """Representation of a Cync command statistic of a home."""
+
+    kinds = {
+        "ack_latency": "Command Ack Latency",
+        "echo_latency": "Command Echo Latency",
+        "retries": "Command Retries",
+        "timeouts": "Command Timeouts",
+        "failed": "Failed Commands",
+    }
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, hub, home_id, kind) -> None:
+        """Initialize the sensor."""
+        self.hub = hub
+        self.home_id = home_id
+        self.kind = kind
+
+    @property
+    def stats(self):
+        return self.hub.home_command_stats.get(self.home_id)
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device registry information for this entity."""
+        return home_device_info(self.hub, self.home_id)
+
+    @property
+    def unique_id(self) -> str:
+        """Return Unique ID string."""
+        return f'cync_{self.kind}_{self.home_id}'
+
+    @property
+    def name(self) -> str:
+        """Return the name of the sensor."""
+        return self.kinds[self.kind]
+
+    @property
+    def native_value(self) -> float | int | None:
+        """Return the median latency in milliseconds or the count of the sensor."""
+        if self.kind in ("ack_latency", "echo_latency"):
+            return milliseconds(getattr(self.stats, self.kind).percentile(0.5)) if self.stats else None
+        return getattr(self.stats, self.kind) if self.stats else 0
+
+    @property
+    def native_unit_of_measurement(self) -> str | None:
+        """Return the unit of measurement."""
+        return UnitOfTime.MILLISECONDS if self.kind in ("ack_latency", "echo_latency") else None
+
+    @property
+    def device_class(self) -> str | None:
+        """Return the device class"""
+        return SensorDeviceClass.DURATION if self.kind in ("ack_latency", "echo_latency") else None
+
+    @property
+    def state_class(self) -> str | None:
+        """Return the state class"""
+        return SensorStateClass.MEASUREMENT if self.kind in ("ack_latency", "echo_latency") else SensorStateClass.TOTAL_INCREASING
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Return the percentiles and histogram of latency sensors."""
+        if self.kind in ("ack_latency", "echo_latency") and self.stats:
+            return latency_attributes(getattr(self.stats, self.kind))
+        return None
+
+class CyncControllerLatencySensorEntity(SensorEntity):
+    """Representation of the command ack latency and counters of a Wi-Fi connected controller."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+
+    def __init__(self, hub, controller) -> None:
+        """Initialize the sensor."""
+        self.hub = hub
+        self.controller = controller
+
+    @property
+    def switch(self):
+        device_ids = self.hub.switchID_to_deviceIDs.get(self.controller, [])
+        return self.hub.cync_switches.get(device_ids[0]) if device_ids else None
+
+    @property
+    def stats(self):
+        return self.hub.controller_command_stats.get(self.controller)
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device registry information for this entity."""
+        switch = self.switch
+        if switch is None or switch.room is None:
+            return home_device_info(self.hub, self.hub.switchID_to_homeID.get(self.controller))
+        return DeviceInfo(
+            identifiers = {(DOMAIN, f"{switch.room.name} ({switch.home_name})")},
+            manufacturer = "Cync by Savant",
+            name = f"{switch.room.name} ({switch.home_name})",
+            suggested_area = f"{switch.room.name}",
+        )
+
+    @property
+    def unique_id(self) -> str:
+        """Return Unique ID string."""
+        return 'cync_controller_ack_latency_' + self.controller
+
+    @property
+    def name(self) -> str:
+        """Return the name of the sensor."""
+        switch = self.switch
+        return (switch.name if switch else "Controller " + self.controller) + " Ack Latency"
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the median ack latency in milliseconds."""
+        return milliseconds(self.stats.ack_latency.percentile(0.5)) if self.stats else None
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Return the latency percentiles and command counters of the controller."""
+        stats = self.stats
+        health = self.hub.controller_health.get(self.controller)
+        if stats is None:
+            return None
+        return {
+            **latency_attributes(stats.ack_latency),
+            "sent": stats.sent,
+            "acked": stats.acked,
+            "retries": stats.retries,
+            "timeouts": stats.timeouts,
+            "failed": stats.failed,
+            "echo_latency_median": milliseconds(stats.echo_latency.percentile(0.5)),
+            "success_rate": round(health.success_rate, 3) if health else None,
+            "demoted": health.demoted if health else False,
+        }
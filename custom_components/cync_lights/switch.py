@@ -18,13 +18,17 @@ async def async_setup_entry(
 ) -> None:
     hub = hass.data[DOMAIN][config_entry.entry_id]
 
-    new_devices = []
-    for switch_id in hub.cync_switches:
-        if not hub.cync_switches[switch_id]._update_callback and hub.cync_switches[switch_id].plug and switch_id in config_entry.options["switches"]:
-            new_devices.append(CyncPlugEntity(hub.cync_switches[switch_id]))
+    def add_new_entities() -> None:
+        new_devices = []
+        for switch_id in hub.cync_switches:
+            if not hub.cync_switches[switch_id]._update_callback and hub.cync_switches[switch_id].plug and switch_id in config_entry.options["switches"]:
+                new_devices.append(CyncPlugEntity(hub.cync_switches[switch_id]))
 
-    if new_devices:
-        async_add_entities(new_devices)
+        if new_devices:
+            async_add_entities(new_devices)
+
+    hub.entity_adders.append(add_new_entities)
+    add_new_entities()
 
 class CyncPlugEntity(SwitchEntity):
     """Representation of a Cync Switch Light Entity."""
@@ -37,7 +41,7 @@ class CyncPlugEntity(SwitchEntity):
 
     async def async_added_to_hass(self) -> None:
         """Run when this Entity has been added to HA."""
-        self.cync_switch.register(self.schedule_update_ha_state)
+        self.cync_switch.register(self.async_write_ha_state)
 
     async def async_will_remove_from_hass(self) -> None:
         """Entity being removed from hass."""
@@ -0,0 +1,164 @@
+"""Tests for reassembling frames from the Cync server stream and decoding them into events."""
+import struct
+
+import pytest
+
+from custom_components.cync_lights.cync_hub import (
+    DEVICE_STATE_RECORD,
+    FRAME_DECODERS,
+    FRAME_HEADER,
+    INITIAL_STATE_RECORD,
+    MAX_FRAME_LENGTH,
+    CommandAck,
+    ControllerOnline,
+    CyncFrameReader,
+    DeviceStates,
+    InitialState,
+    PushReceived,
+    SensorChange,
+    StateChange,
+    decode_frame,
+)
+
+SWITCH_ID = 1234567
+
+def frame(packet_type, packet):
+    return FRAME_HEADER.pack(packet_type, len(packet)) + packet
+
+def read_frames(frame_reader, data):
+    frame_reader.feed(data)
+    return [(packet_type, bytes(packet)) for packet_type, packet in frame_reader.frames()]
+
+def packet(length, subtype = None, seq = 17):
+    packet = bytearray(length)
+    packet[0:6] = struct.pack(">IH", SWITCH_ID, seq)
+    if subtype is not None:
+        packet[13] = subtype
+    return packet
+
+def state_change_packet(state = 1, brightness = 80):
+    state_change = packet(33, 219)
+    state_change[21] = 5
+    state_change[27] = state
+    state_change[28] = brightness
+    return bytes(state_change)
+
+def sensor_packet(motion = 1, ambient_light = 0):
+    sensor = packet(25, 84)
+    sensor[16] = 7
+    sensor[22] = motion
+    sensor[24] = ambient_light
+    return bytes(sensor)
+
+def test_frame_reader_single_frame():
+    assert read_frames(CyncFrameReader(), frame(123, b'abcdef')) == [(123, b'abcdef')]
+
+def test_frame_reader_header_split_across_reads():
+    frame_reader = CyncFrameReader()
+    data = frame(123, b'abcdef')
+    for end in range(1, FRAME_HEADER.size):
+        assert read_frames(frame_reader, data[end - 1:end]) == []
+    assert read_frames(frame_reader, data[FRAME_HEADER.size - 1:]) == [(123, b'abcdef')]
+
+def test_frame_reader_frame_spanning_reads():
+    frame_reader = CyncFrameReader()
+    data = frame(67, bytes(range(100)))
+    assert read_frames(frame_reader, data[:20]) == []
+    assert read_frames(frame_reader, data[20:60]) == []
+    assert read_frames(frame_reader, data[60:]) == [(67, bytes(range(100)))]
+
+def test_frame_reader_byte_at_a_time():
+    frames = [(123, b'abcdef'), (171, b'\x00\x12\xd6\x87'), (67, bytes(range(30)))]
+    data = b''.join(frame(packet_type, packet) for packet_type, packet in frames)
+    frame_reader = CyncFrameReader()
+    assert [received for i in range(len(data)) for received in read_frames(frame_reader, data[i:i + 1])] == frames
+
+def test_frame_reader_multiple_frames_per_read():
+    frames = [(123, b'abcdef'), (171, b'\x00\x12\xd6\x87'), (115, b'')]
+    data = b''.join(frame(packet_type, packet) for packet_type, packet in frames)
+    assert read_frames(CyncFrameReader(), data) == frames
+
+def test_frame_reader_keeps_partial_frame_after_complete_ones():
+    frame_reader = CyncFrameReader()
+    first, second = frame(123, b'abcdef'), frame(131, b'ghijklmnop')
+    assert read_frames(frame_reader, first + second[:7]) == [(123, b'abcdef')]
+    assert read_frames(frame_reader, second[7:] + first) == [(131, b'ghijklmnop'), (123, b'abcdef')]
+
+def test_frame_reader_releases_packets():
+    frame_reader = CyncFrameReader()
+    frame_reader.feed(frame(123, b'abcdef') + frame(123, b'ghijkl'))
+    frames = frame_reader.frames()
+    packet_type, first = next(frames)
+    next(frames)
+    with pytest.raises(ValueError):
+        bytes(first)
+
+def test_frame_reader_discards_oversized_frame():
+    frame_reader = CyncFrameReader()
+    assert read_frames(frame_reader, FRAME_HEADER.pack(115, MAX_FRAME_LENGTH + 1) + b'garbage') == []
+    assert read_frames(frame_reader, frame(123, b'abcdef')) == [(123, b'abcdef')]
+
+@pytest.mark.parametrize("packet_type, subtype", list(FRAME_DECODERS))
+def test_decoder_accepts_minimum_length(packet_type, subtype):
+    min_length, decoder = FRAME_DECODERS[(packet_type, subtype)]
+    minimum = packet(min_length, subtype)
+    if packet_type == 67:
+        minimum[4:7] = bytes([1, 1, 6])
+    events = decoder(bytes(minimum))
+    assert len(events) > 0
+    for event in events:
+        if isinstance(event, (InitialState, DeviceStates)):
+            list(event.records)
+
+def test_pushed_state_change():
+    assert decode_frame(115, state_change_packet()) == (PushReceived(str(SWITCH_ID), 17), StateChange(str(SWITCH_ID), 5, True, 80))
+
+def test_state_change_off_has_no_brightness():
+    assert decode_frame(131, state_change_packet(state = 0)) == (StateChange(str(SWITCH_ID), 5, False, 0),)
+
+def test_pushed_sensor_change():
+    assert decode_frame(115, sensor_packet()) == (PushReceived(str(SWITCH_ID), 17), SensorChange(str(SWITCH_ID), 7, True, False))
+
+def test_sensor_change():
+    assert decode_frame(131, sensor_packet(motion = 0, ambient_light = 1)) == (SensorChange(str(SWITCH_ID), 7, False, True),)
+
+def test_initial_state_records():
+    records = [(mesh_index, 1, 50 + mesh_index, 254, 255, 0, mesh_index) for mesh_index in range(3)]
+    initial_state = bytes(packet(22, 82)) + b''.join(INITIAL_STATE_RECORD.pack(*record) for record in records) + b'\x7e'*8
+    push, state = decode_frame(115, initial_state)
+    assert push == PushReceived(str(SWITCH_ID), 17)
+    assert state.switch_id == str(SWITCH_ID)
+    assert list(state.records) == records
+
+def test_initial_state_ignores_partial_record():
+    records = [(mesh_index, 1, 100, 50, 0, 0, 0) for mesh_index in range(2)]
+    initial_state = bytes(packet(22, 82)) + b''.join(INITIAL_STATE_RECORD.pack(*record) for record in records) + bytes(INITIAL_STATE_RECORD.size - 1)
+    assert list(decode_frame(115, initial_state)[1].records) == records
+
+def test_device_states_records():
+    records = [(mesh_index, 1, 50, 254, 255, 128, 0) for mesh_index in range(4)]
+    device_states = struct.pack(">I", SWITCH_ID) + bytes([1, 1, 6]) + b''.join(DEVICE_STATE_RECORD.pack(*record) for record in records)
+    (states,) = decode_frame(67, device_states)
+    assert states.switch_id == str(SWITCH_ID)
+    assert list(states.records) == records
+
+def test_device_states_ignores_other_reports():
+    device_states = struct.pack(">I", SWITCH_ID) + bytes([1, 1, 7]) + bytes(DEVICE_STATE_RECORD.size)
+    assert decode_frame(67, device_states) == ()
+
+def test_controller_online():
+    assert decode_frame(171, struct.pack(">I", SWITCH_ID) + b'\x00\x00\x00') == (ControllerOnline(str(SWITCH_ID)),)
+
+def test_command_ack():
+    assert decode_frame(123, struct.pack(">IHB", SWITCH_ID, 42, 0)) == (CommandAck(str(SWITCH_ID), "42"),)
+
+def test_unknown_subtype_falls_back_to_push():
+    assert decode_frame(115, bytes(packet(40, 99))) == (PushReceived(str(SWITCH_ID), 17),)
+
+def test_short_subtype_packet_falls_back_to_push():
+    assert decode_frame(115, state_change_packet()[:32]) == (PushReceived(str(SWITCH_ID), 17),)
+
+def test_short_or_unknown_frames_decode_to_nothing():
+    assert decode_frame(131, state_change_packet()[:32]) == ()
+    assert decode_frame(123, b'\x00\x01') == ()
+    assert decode_frame(200, state_change_packet()) == ()